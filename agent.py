@@ -1,14 +1,19 @@
 import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage
-from datetime import datetime
-import pytz
-import rag_manager
 import db
+import ingest_jobs
 import uuid
 
 # Import modules
-from agent_factory import AgentFactory
-from tools_library import get_search_tool, calendar_tools, email_tools, rag_tools
+from agent_registry import get_registry, cache_stats, today
+import semantic_cache
+import tracing
+from streaming import stream_turn
+import embedding_cache
+import tool_executor
+import llm_scheduler
+import intent_router
+import metrics
 
 st.set_page_config(page_title="Mimi - Enterprise", page_icon="💃")
 st.title("Mimi (Context-Aware Edition)")
@@ -17,6 +22,66 @@ if "GROQ_API_KEY" not in st.secrets:
     st.error("⚠️ Groq API Key missing.")
     st.stop()
 
+# --- AGENTS (built once per process, shared by all sessions) ---
+registry = get_registry()
+mimi = registry.mimi
+
+# Messages drawn per rerun; older ones stay behind "Show earlier messages"
+RENDER_WINDOW = 30
+# Stored messages older than the opened page that the agent still reads
+AGENT_EARLIER_MESSAGES = db.MESSAGES_PAGE_SIZE
+
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
+
+def to_messages(rows):
+    """
+    chat_history rows -> LangChain objects.
+    """
+    return [
+        HumanMessage(content=m['content']) if m['role'] == 'user'
+        else AIMessage(content=m['content'])
+        for m in rows
+    ]
+
+
+def open_session(session_id, rows=(), cursor=None):
+    """
+    Makes session_id the current chat. rows: its newest stored messages
+    (a db.get_messages_page page), cursor: where the older ones start.
+    """
+    st.session_state.session_id = session_id
+    st.session_state.messages = to_messages(rows)
+    st.session_state.history_cursor = cursor
+    st.session_state.render_count = RENDER_WINDOW
+    # What the agent sees of the stored chat (see agent_messages)
+    st.session_state.opened_cursor = cursor
+    st.session_state.prepended = 0
+    st.session_state.earlier_messages = None
+
+
+def agent_messages():
+    """
+    The chat as the agent sees it: up to AGENT_EARLIER_MESSAGES stored before
+    the page the chat was opened with (one page read on the first turn, never
+    drawn), that page and this visit's turns. Anything older is not sent:
+    a turn never costs more than a page of reads and summary work. Pages
+    added with "Load earlier messages" are for display only.
+    """
+    own = st.session_state.messages[st.session_state.prepended:]
+    cursor = st.session_state.opened_cursor
+    if cursor is None or not AGENT_EARLIER_MESSAGES:
+        return own
+    earlier = st.session_state.earlier_messages
+    if earlier is None:
+        rows, _ = db.get_messages_page(st.session_state.session_id, limit=AGENT_EARLIER_MESSAGES, before=cursor)
+        earlier = to_messages(rows)
+        if rows:
+            # Not cached when the read failed: try again next turn
+            st.session_state.earlier_messages = earlier
+    return earlier + own
+
 #SIDEBAR
 with st.sidebar:
 
@@ -25,7 +90,7 @@ with st.sidebar:
         if st.button("Show all memories"):
             try:
                 # Fetch the raw text from Supabase
-                data = db.supabase.table("documents").select("content").limit(5).execute()
+                data = db.get_supabase_client().table("documents").select("content").limit(5).execute()
                 if data.data:
                     for i, doc in enumerate(data.data):
                         st.text_area(f"Memory Chunk {i+1}", doc['content'], height=100)
@@ -34,140 +99,145 @@ with st.sidebar:
             except Exception as e:
                 st.error(f"Debug Error: {e}")
 
+        stats = cache_stats()
+        hit_rate = "n/a" if stats["hit_rate"] is None else f"{stats['hit_rate']:.0%}"
+        st.caption(f"Agent graph built in {stats['build_seconds']:.2f}s · cache hit rate {hit_rate} ({stats['lookups']} lookups)")
+
+        ttft = metrics.summary("chat.ttft_seconds")
+        if ttft:
+            st.caption(f"Time to first token: p50 {ttft['p50']:.2f}s · p95 {ttft['p95']:.2f}s ({ttft['count']} turns)")
+
+        emb = embedding_cache.stats()
+        if emb["hit_rate"] is not None:
+            st.caption(f"Embedding cache: {emb['hit_rate']:.0%} hits "
+                       f"({emb['memory_hits']} memory, {emb['disk_hits']} disk, {emb['misses']} misses)")
+
+        last_trace = st.session_state.get("last_trace_id")
+        chart = tracing.waterfall(last_trace) if last_trace else None
+        if chart:
+            st.caption("Last turn")
+            st.code(chart, language=None)
+
+        answers = metrics.hit_rate("semantic_cache.hits", "semantic_cache.misses")
+        if answers is not None:
+            st.caption(f"Answer cache hit rate: {answers:.0%}")
+
+        llm = llm_scheduler.stats()
+        if llm["wait"]:
+            st.caption(f"LLM queue: {llm['queue_depth']} waiting · wait p50 {llm['wait']['p50']:.2f}s "
+                       f"p95 {llm['wait']['p95']:.2f}s · {llm['rate_limited']} rate limited · {llm['rejected']} refused")
+
+        routing = intent_router.stats()
+        if routing["routed_share"] is not None:
+            reasons = ", ".join(f"{k} {v}" for k, v in routing["reasons"].items()) or "none"
+            st.caption(f"Intent router: {routing['routed_share']:.0%} of turns skipped the root agent "
+                       f"({routing['routed']} routed · fallbacks: {reasons})")
+
+    stream_responses = st.toggle("Stream responses", value=True)
+
     st.header("🧠 Knowledge Base")
-    # PDF Uploader
-    uploaded_file = st.file_uploader("Upload PDF (Internal Docs)", type=["pdf"])
-    if uploaded_file and st.button("Process PDF"):
-        with st.spinner("Ingesting document..."):
-            result = rag_manager.ingest_pdf(uploaded_file)
-            if "Success" in result:
-                st.success(result)
-            else:
-                st.error(result)
+    # PDF Uploader: files are ingested by a background job, chat stays usable meanwhile
+    uploaded_files = st.file_uploader("Upload PDFs (Internal Docs)", type=["pdf"], accept_multiple_files=True)
+    if uploaded_files and st.button("Process PDFs"):
+        job = ingest_jobs.submit_uploads(uploaded_files)
+        st.session_state.setdefault("ingest_jobs", []).append(job.id)
+
+    if st.secrets.get("ADMIN_MODE", False):
+        with st.expander("🗂️ Backfill a directory"):
+            directory = st.text_input("Folder on the server")
+            if directory and st.button("Start backfill"):
+                try:
+                    job = ingest_jobs.submit_directory(directory)
+                    st.session_state.setdefault("ingest_jobs", []).append(job.id)
+                except ValueError as e:
+                    st.error(str(e))
+
+    jobs = [ingest_jobs.get_job(job_id) for job_id in st.session_state.get("ingest_jobs", [])]
+    jobs = [job for job in jobs if job is not None]
+    if jobs:
+        # Redraws itself every 2s while something is still running
+        polling = any(not job.done for job in jobs)
+
+        @st.fragment(run_every=2 if polling else None)
+        def show_ingest_jobs():
+            for job in reversed(jobs[-3:]):
+                st.caption(job.label)
+                for f in job.snapshot():
+                    icon = {"queued": "⏳", "parsing": "📄", "storing": "💾", "done": "✅", "failed": "❌"}[f["state"]]
+                    if f["state"] == "done":
+                        st.caption(f"{icon} {f['name']}: {f['added']} new, {f['unchanged']} unchanged, {f['removed']} removed")
+                    elif f["state"] == "failed":
+                        st.caption(f"{icon} {f['name']}: {f['error']} (process it again to resume)")
+                    else:
+                        pages = f"page {f['pages_done']}/{f['pages']}" if f["pages"] else f["state"]
+                        st.caption(f"{icon} {f['name']}: {pages} · {f['chunks']} chunks")
+            if polling and all(job.done for job in jobs):
+                # run_every is fixed for this script run: one full rerun stops the polling
+                st.rerun()
+
+        show_ingest_jobs()
     
     st.divider()
     
     st.header("🗄️ Chat History")
     # New Chat Button
     if st.button("➕ New Chat", use_container_width=True):
-        st.session_state.session_id = str(uuid.uuid4())
-        st.session_state.messages = []
+        open_session(str(uuid.uuid4()))
         st.rerun()
     
     # Load Past Sessions from Supabase
+    # The first page is re-read on every rerun (so new chats show up),
+    # older pages are only fetched when "Load more" is clicked.
     try:
-        sessions = db.get_all_sessions()
+        first_page, first_cursor = db.get_sessions_page()
+        if not st.session_state.get("older_sessions"):
+            # Nothing extra loaded yet: follow the first page's cursor
+            st.session_state.older_sessions = []
+            st.session_state.sessions_cursor = first_cursor
+
+        seen = {s['id'] for s in first_page}
+        sessions = first_page + [s for s in st.session_state.older_sessions if s['id'] not in seen]
+
         for s in sessions:
             col1, col2 = st.columns([0.8, 0.2])
             with col1:
                 if st.button(f"💬 {s['title']}", key=s['id'], use_container_width=True):
-                    st.session_state.session_id = s['id']
-                    # Load messages from DB -> Convert to LangChain objects
-                    raw_msgs = db.get_messages(s['id'])
-                    st.session_state.messages = [
-                        HumanMessage(content=m['content']) if m['role'] == 'user' 
-                        else AIMessage(content=m['content']) 
-                        for m in raw_msgs
-                    ]
+                    # Only the newest page; older pages are fetched on demand
+                    open_session(s['id'], *db.get_messages_page(s['id']))
                     st.rerun()
             with col2:
                 if st.button("🗑️", key=f"del_{s['id']}"):
                     db.delete_session(s['id'])
+                    st.session_state.older_sessions = [o for o in st.session_state.older_sessions if o['id'] != s['id']]
                     if st.session_state.session_id == s['id']:
-                        st.session_state.session_id = str(uuid.uuid4())
-                        st.session_state.messages = []
+                        open_session(str(uuid.uuid4()))
                     st.rerun()
+
+        if st.session_state.sessions_cursor and st.button("Load more", use_container_width=True):
+            page, cursor = db.get_sessions_page(cursor=st.session_state.sessions_cursor)
+            st.session_state.older_sessions += page
+            st.session_state.sessions_cursor = cursor
+            st.rerun()
     except Exception as e:
         st.warning(f"Could not load history: {e}")
 
-# --- INITIALIZE FACTORY ---
-factory = AgentFactory()
-
-# --- CREATE SPECIALIST AGENTS ---
-# 1. Research
-research_tool = get_search_tool()
-if research_tool:
-    research_agent = factory.create_agent_as_tool(
-        name="Research_Specialist",
-        system_prompt="Search Tavily and summarize findings. Make sure you always send the information in reverse chronological order. Trust the query's specific details over your general knowledge.",
-        tools=[research_tool],
-        description="Search for news, facts, or web info."
-    )
-else:
-    research_agent = None 
-
-# 2. Calendar
-calendar_agent = factory.create_agent_as_tool(
-    name="Calendar_Specialist",
-    system_prompt="Manage calendar events. Use ISO format.",
-    tools=calendar_tools,
-    description="Check schedule or create calendar events."
-)
-
-# 3. Email
-email_agent = factory.create_agent_as_tool(
-    name="Communication_Specialist",
-    system_prompt="Read unread emails or send new emails. Be concise, but follow 100% the email body you were sent, do not change it!.",
-    tools=email_tools,
-    description="Read or send emails."
-)
-
-#RAG
-knowledge_agent = factory.create_agent_as_tool(
-    name="Knowledge_Specialist",
-    system_prompt="""You are the keeper of the user's personal history and preferences.
-    The database contains their travel logs, favourite foods, friends, and past projects.
-    
-    RULE: If the user asks a question about THEMSELVES (e.g., "What do I like?", "Where should I go?"), 
-    you MUST query the database first. Do not assume you don't know.""",
-    tools=rag_tools,
-    description="The FIRST place to check for ANY question about the user's preferences, history, or files."
-)
-
-# --- ROOT AGENT ---
-specialists = [t for t in [research_agent, calendar_agent, email_agent] if t is not None]
-all_tools = specialists + rag_tools
-
-london_tz = pytz.timezone('Europe/London')
-current_full_date = datetime.now(london_tz).strftime("%A, %B %d, %Y")
-current_time = datetime.now(london_tz).strftime("%I:%M %p")
-
-# We update the System Prompt to force "Query Expansion"
-mimi = factory.create_agent(
-    name="Mimi_Root",
-    system_prompt=f"""
-    CONTEXT:
-    - Today is: {current_full_date}
-    - Time is: {current_time}
-    
-    You are Mimi, the Chief of Staff.
-    
-    - Today is: {current_full_date}
-    
-    You are Mimi, the Chief of Staff.
-    
-    You have direct access to a 'Knowledge Base' (consult_knowledge_base).
-    It contains the user's uploaded PDFs, preferences, and favorite destinations.
-    
-    ⚠️ TRIGGER RULES:
-    1. If the user asks "What is in your database?", CALL 'consult_knowledge_base' with query="summary".
-    2. If the user asks for "Destinations" or "Preferences", CALL 'consult_knowledge_base'.
-    
-    Do not say "I don't have access." You DO have access. Use the tool!
-    
-    Delegate tasks to your specialists:
-    1. Research Specialist (News, Sports, Weather)
-    2. Calendar Specialist (Schedule)
-    3. Communication Specialist (Email)
-    """,
-    tools=all_tools
-)
-
 # --- CHAT LOOP ---
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    open_session(st.session_state.session_id)
+
+# A rerun draws at most render_count messages, however long the chat is
+hidden = max(0, len(st.session_state.messages) - st.session_state.render_count)
+if hidden or st.session_state.history_cursor:
+    if st.button(f"⬆️ Show earlier messages ({hidden} loaded)" if hidden else "⬆️ Load earlier messages"):
+        if not hidden:
+            rows, cursor = db.get_messages_page(st.session_state.session_id, before=st.session_state.history_cursor)
+            st.session_state.messages = to_messages(rows) + st.session_state.messages
+            st.session_state.prepended += len(rows)
+            st.session_state.history_cursor = cursor
+        st.session_state.render_count += RENDER_WINDOW
+        st.rerun()
 
-for msg in st.session_state.messages:
+for msg in st.session_state.messages[-st.session_state.render_count:]:
     if isinstance(msg, (HumanMessage, AIMessage)):
         role = "user" if isinstance(msg, HumanMessage) else "assistant"
         st.chat_message(role).write(msg.content)
@@ -175,13 +245,66 @@ for msg in st.session_state.messages:
 if user_input := st.chat_input("How can I help?"):
     st.chat_message("user").write(user_input)
     st.session_state.messages.append(HumanMessage(content=user_input))
+    # Persisted off the request path (batched by a background thread)
+    db.get_journal().append(st.session_state.session_id, "user", user_input)
+
+    # One trace per turn: every LLM call, tool, embedding and DB call nests under it
+    # Root-priority, per-session tag for every model call of this turn (see llm_scheduler.py)
+    with tracing.span("turn", session_id=st.session_state.session_id, streaming=stream_responses) as turn, \
+            llm_scheduler.caller(session=st.session_state.session_id, priority=llm_scheduler.ROOT):
+        # Same question, same day, same previous reply -> same answer (within the TTLs)
+        previous_reply = next((m.content for m in reversed(st.session_state.messages[:-1]) if isinstance(m, AIMessage)), "")
+        fingerprint = semantic_cache.context_fingerprint(today(), previous_reply)
+        cache = registry.response_cache
+        hit = cache.lookup("Mimi_Root", user_input, fingerprint) if cache else None
+        route = None
+
+        with st.chat_message("assistant"):
+            if hit:
+                final_answer = hit[0]
+                st.markdown(final_answer)
+                st.caption("⚡ Answered from cache")
+            else:
+                # Only on a miss: summarising may cost model calls, a hit must not.
+                # Last turns verbatim + a rolling summary of the rest, within the token budget
+                history = registry.history.prepare(st.session_state.session_id, agent_messages())
+                status = None
+                try:
+                    with semantic_cache.track() as used:
+                        # Simple single-intent requests skip the root agent (1-2 model calls instead of 4)
+                        route = registry.router.route(user_input, follow_up=len(st.session_state.messages) > 1) \
+                            if registry.router else None
+                        if route:
+                            status = st.status(f"⚡ {route['target']}...", expanded=False)
+                            answer = registry.router.run(route, history)
+                            final_answer = st.write_stream(answer) if stream_responses else "".join(answer)
+                            status.update(label=f"⚡ Routed to {route['target']} ({route['method']})",
+                                          state="complete", expanded=False)
+                            if not stream_responses:
+                                st.markdown(final_answer)
+                        elif stream_responses:
+                            status = st.status("Thinking...", expanded=True)
+                            final_answer = st.write_stream(stream_turn(mimi, {"messages": history}, status))
+                            status.update(label="Done", state="complete", expanded=False)
+                        else:
+                            with st.status("Thinking...", expanded=True) as status:
+                                response_state = tool_executor.run(lambda: mimi.ainvoke({"messages": history}))
+                                status.update(label="Done", state="complete", expanded=False)
+
+                            final_answer = response_state["messages"][-1].content
+                            semantic_cache.note(*semantic_cache.tool_names(response_state["messages"]))
+                            st.markdown(final_answer)
+                    if cache:
+                        cache.store("Mimi_Root", user_input, final_answer, fingerprint, depends_on=used)
+                except llm_scheduler.RateLimited as e:
+                    # Quota exhausted even after queueing and retries: say so plainly
+                    if status is not None:
+                        status.update(label="Rate limited", state="error", expanded=False)
+                    final_answer = f"⏳ {e}"
+                    st.warning(final_answer)
+        turn.set("cache_hit", bool(hit))
+        turn.set("routed", bool(not hit and route))
+    st.session_state.last_trace_id = turn.trace_id
 
-    with st.chat_message("assistant"):
-        with st.status("Thinking...", expanded=True) as status:
-            response_state = mimi.invoke({"messages": st.session_state.messages})
-            status.update(label="Done", state="complete", expanded=False)
-            
-        final_answer = response_state["messages"][-1].content
-        st.markdown(final_answer)
-    
     st.session_state.messages.append(AIMessage(content=final_answer))
+    db.get_journal().append(st.session_state.session_id, "assistant", final_answer)
@@ -1,50 +1,191 @@
 import streamlit as st
-from langchain_groq import ChatGroq
+import asyncio
 from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware, dynamic_prompt, ModelRequest
 from langchain_core.tools import Tool
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, AIMessageChunk
+from langgraph.config import get_stream_writer
+
+import llm_scheduler
+import tool_executor
+import semantic_cache
+import tracing
+
+
+def _progress_writer():
+    """
+    Returns the LangGraph stream writer when we run inside a graph, else None.
+    When the root agent is not streaming "custom" events the writer is a no-op.
+    """
+    try:
+        return get_stream_writer()
+    except (RuntimeError, KeyError):
+        # KeyError: inside a runnable but not a graph (e.g. invoked by intent_router)
+        return None
+
+
+class _NoteToolCalls(AgentMiddleware):
+    """
+    Tells semantic_cache about every tool call when it starts, not when the
+    run succeeds: a run that sent an email and then failed must still keep
+    the answers around it out of the cache.
+    """
+
+    def wrap_tool_call(self, request, handler):
+        semantic_cache.note(request.tool_call["name"])
+        return handler(request)
+
+    async def awrap_tool_call(self, request, handler):
+        semantic_cache.note(request.tool_call["name"])
+        return await handler(request)
+
 
 class AgentFactory:
-    def __init__(self):
-        self.llm = ChatGroq(
-            model="meta-llama/llama-4-maverick-17b-128e-instruct", 
+    def __init__(self, response_cache=None):
+        # Optional semantic_cache.SemanticCache shared by every specialist we build
+        self.response_cache = response_cache
+        # Imported here so that importing this module stays cheap
+        from langchain_groq import ChatGroq
+        # Shared by every session: calls are queued/rate limited process-wide
+        # (see llm_scheduler.py), which also does the 429 retries
+        self.llm = llm_scheduler.scheduled(ChatGroq)(
+            model="meta-llama/llama-4-maverick-17b-128e-instruct",
             api_key=st.secrets["GROQ_API_KEY"],
             temperature=0.7,
-            max_tokens=4096 
+            max_tokens=4096,
+            max_retries=0,
+            # Every model call becomes a span (model, tokens, wall time)
+            callbacks=[tracing.TracingCallbackHandler()]
         )
 
-    def create_agent(self, name: str, system_prompt: str, tools: list):
+    def create_agent(self, name: str, system_prompt: str, tools: list, dynamic_context=None):
         """
-        Creates a v1 Agent. 
+        Creates a v1 Agent.
         In LangChain v1.x, create_agent returns a CompiledGraph (Runnable).
+
+        dynamic_context: optional callable returning text that is put in front of
+        the system prompt on every model call (e.g. today's date). This lets us
+        build the graph once and still give it fresh per-request values.
         """
+        full_prompt = f"You are {name}. {system_prompt}"
+        middleware = [_NoteToolCalls()]
+
+        if dynamic_context is not None:
+            @dynamic_prompt
+            def with_context(request: ModelRequest) -> str:
+                return f"{dynamic_context()}\n\n{full_prompt}"
+
+            middleware.append(with_context)
+
         # The v1 API simplifies everything into this single constructor
         return create_agent(
             model=self.llm,
             tools=tools,
-            system_prompt=f"You are {name}. {system_prompt}"
+            system_prompt=full_prompt,
+            middleware=middleware
         )
 
-    def create_agent_as_tool(self, name: str, system_prompt: str, tools: list, description: str):
+    def create_agent_as_tool(self, name: str, system_prompt: str, tools: list, description: str, dynamic_context=None):
         """
         Wraps a sub-agent as a tool.
+        dynamic_context: as in create_agent (e.g. today's date for resolving "tomorrow").
         """
-        agent_runner = self.create_agent(name, system_prompt, tools)
-        
+        agent_runner = self.create_agent(name, system_prompt, tools, dynamic_context=dynamic_context)
+        cache = self.response_cache
+
+        def cached_answer(query):
+            if cache is None:
+                return None
+            hit = cache.lookup(name, query)
+            if hit is None:
+                return None
+            answer, depends_on = hit
+            # Whoever called us now depends on the same tools (affects their TTL)
+            semantic_cache.note(*depends_on)
+            return answer
+
+        def remember(query, result, used):
+            # v1 Response Extraction:
+            # The result is the final state, so we get the last message's content
+            answer = result["messages"][-1].content
+            names = semantic_cache.tool_names(result["messages"]) | used
+            semantic_cache.note(name, *names)
+            if cache is not None:
+                cache.store(name, query, answer, depends_on=names)
+            return answer
+
         def run_agent(query: str):
             # v1 Agents (Graph-based) expect a dict with "messages"
             inputs = {"messages": [HumanMessage(content=query)]}
-            
+
+            answer = cached_answer(query)
+            if answer is not None:
+                tracing.set_attribute(f"{name}.cache_hit", True)
+                return answer
+
             try:
-                result = agent_runner.invoke(inputs)
-                # v1 Response Extraction:
-                # The result is the final state, so we get the last message's content
-                return result["messages"][-1].content
+                with tracing.span(f"agent {name}", query=query), semantic_cache.track() as used, \
+                        llm_scheduler.caller(priority=llm_scheduler.SUBAGENT):
+                    writer = _progress_writer()
+                    if writer is None:
+                        result = agent_runner.invoke(inputs)
+                    else:
+                        # Called from the root graph: forward our tokens so the UI can show progress
+                        writer({"agent": name, "event": "start", "query": query})
+                        result = None
+                        for mode, chunk in agent_runner.stream(inputs, stream_mode=["messages", "values"]):
+                            if mode == "values":
+                                result = chunk
+                            elif isinstance(chunk[0], AIMessageChunk) and chunk[0].content:
+                                writer({"agent": name, "event": "token", "text": chunk[0].content})
+                        writer({"agent": name, "event": "end"})
+                return remember(query, result, used)
+            except llm_scheduler.RateLimited as e:
+                return f"{name} could not answer: {e}"
+            except Exception as e:
+                return f"Error executing {name}: {e}"
+
+        async def arun_agent(query: str):
+            # Same as run_agent, but awaitable: when the root agent asks for several
+            # specialists in one step they run at the same time (see tool_executor).
+            inputs = {"messages": [HumanMessage(content=query)]}
+            writer = _progress_writer()
+
+            async def call():
+                if writer is None:
+                    return await agent_runner.ainvoke(inputs)
+
+                writer({"agent": name, "event": "start", "query": query})
+                result = None
+                async for mode, chunk in agent_runner.astream(inputs, stream_mode=["messages", "values"]):
+                    if mode == "values":
+                        result = chunk
+                    elif isinstance(chunk[0], AIMessageChunk) and chunk[0].content:
+                        writer({"agent": name, "event": "token", "text": chunk[0].content})
+                writer({"agent": name, "event": "end"})
+                return result
+
+            try:
+                answer = await asyncio.to_thread(cached_answer, query)
+                if answer is not None:
+                    tracing.set_attribute(f"{name}.cache_hit", True)
+                    return answer
+                with tracing.span(f"agent {name}", query=query), semantic_cache.track() as used, \
+                        llm_scheduler.caller(priority=llm_scheduler.SUBAGENT):
+                    result = await tool_executor.run_tool(name, call)
+                return remember(query, result, used)
+            except asyncio.TimeoutError:
+                # It may still call any of its tools after we gave up on it
+                semantic_cache.note(*(tool.name for tool in tools))
+                return f"{name} did not answer within {tool_executor.timeout_for(name)}s. Try again or ask something narrower."
+            except llm_scheduler.RateLimited as e:
+                return f"{name} could not answer: {e}"
             except Exception as e:
                 return f"Error executing {name}: {e}"
 
         return Tool(
             name=name,
             func=run_agent,
+            coroutine=arun_agent,
             description=description
-        )
\ No newline at end of file
+        )
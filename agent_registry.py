@@ -0,0 +1,172 @@
+import streamlit as st
+import time
+from datetime import datetime
+import pytz
+
+import clients
+import metrics
+from semantic_cache import SemanticCache
+from agent_factory import AgentFactory
+from history_manager import HistoryManager, TOKEN_BUDGET
+from intent_router import IntentRouter, SIMILARITY_THRESHOLD
+from tools_library import get_search_tool, calendar_tools, email_tools, rag_tools
+
+london_tz = pytz.timezone('Europe/London')
+
+# The date/time is NOT baked in here: the graph is cached for the whole process,
+# so context_block() is added on every model call instead.
+ROOT_PROMPT = """
+    You are Mimi, the Chief of Staff.
+
+    You have direct access to a 'Knowledge Base' (consult_knowledge_base).
+    It contains the user's uploaded PDFs, preferences, and favorite destinations.
+
+    ⚠️ TRIGGER RULES:
+    1. If the user asks "What is in your database?", CALL 'consult_knowledge_base' with query="summary".
+    2. If the user asks for "Destinations" or "Preferences", CALL 'consult_knowledge_base'.
+
+    Do not say "I don't have access." You DO have access. Use the tool!
+
+    Delegate tasks to your specialists:
+    1. Research Specialist (News, Sports, Weather)
+    2. Calendar Specialist (Schedule)
+    3. Communication Specialist (Email)
+    """
+
+
+def today():
+    return datetime.now(london_tz).date().isoformat()
+
+
+def context_block():
+    """
+    Per-request values for the root prompt. Called at invoke time, never cached.
+    """
+    now = datetime.now(london_tz)
+    return f"""
+    CONTEXT:
+    - Today is: {now.strftime("%A, %B %d, %Y")}
+    - Time is: {now.strftime("%I:%M %p")}
+    """
+
+
+class AgentRegistry:
+    """
+    Holds the factory, the specialist tools and the root agent.
+    Built once per process (see get_registry) and shared by every session.
+    """
+
+    def __init__(self):
+        start = time.perf_counter()
+        # Optional: answers to near-identical questions are reused (see semantic_cache.py)
+        self.response_cache = None
+        if st.secrets.get("SEMANTIC_CACHE", True):
+            self.response_cache = SemanticCache(clients.embed_query)
+        self.factory = AgentFactory(response_cache=self.response_cache)
+
+        # --- CREATE SPECIALIST AGENTS ---
+        # Each gets today's date too: the intent router may call them without
+        # the root agent resolving "tomorrow at 3pm" first
+        # 1. Research
+        research_tool = get_search_tool()
+        if research_tool:
+            self.research_agent = self.factory.create_agent_as_tool(
+                name="Research_Specialist",
+                system_prompt="Search Tavily and summarize findings. Make sure you always send the information in reverse chronological order. Trust the query's specific details over your general knowledge.",
+                tools=[research_tool],
+                description="Search for news, facts, or web info.",
+                dynamic_context=context_block
+            )
+        else:
+            self.research_agent = None
+
+        # 2. Calendar
+        self.calendar_agent = self.factory.create_agent_as_tool(
+            name="Calendar_Specialist",
+            system_prompt="Manage calendar events. Use ISO format.",
+            tools=calendar_tools,
+            description="Check schedule or create calendar events.",
+            dynamic_context=context_block
+        )
+
+        # 3. Email
+        self.email_agent = self.factory.create_agent_as_tool(
+            name="Communication_Specialist",
+            system_prompt="Read unread emails or send new emails. Be concise, but follow 100% the email body you were sent, do not change it!.",
+            tools=email_tools,
+            description="Read or send emails.",
+            dynamic_context=context_block
+        )
+
+        # RAG
+        self.knowledge_agent = self.factory.create_agent_as_tool(
+            name="Knowledge_Specialist",
+            system_prompt="""You are the keeper of the user's personal history and preferences.
+    The database contains their travel logs, favourite foods, friends, and past projects.
+
+    RULE: If the user asks a question about THEMSELVES (e.g., "What do I like?", "Where should I go?"),
+    you MUST query the database first. Do not assume you don't know.""",
+            tools=rag_tools,
+            description="The FIRST place to check for ANY question about the user's preferences, history, or files.",
+            dynamic_context=context_block
+        )
+
+        # --- ROOT AGENT ---
+        self.specialists = [t for t in [self.research_agent, self.calendar_agent, self.email_agent] if t is not None]
+        self.all_tools = self.specialists + rag_tools
+
+        self.mimi = self.factory.create_agent(
+            name="Mimi_Root",
+            system_prompt=ROOT_PROMPT,
+            tools=self.all_tools,
+            dynamic_context=context_block
+        )
+
+        # Optional: simple single-intent requests skip the root agent (see intent_router.py)
+        self.router = None
+        if st.secrets.get("INTENT_ROUTER", True):
+            self.router = IntentRouter(
+                tools=self.all_tools + calendar_tools + email_tools,
+                llm=self.factory.llm,
+                embed_query=clients.embed_query,
+                embed_documents=lambda texts: clients.embeddings().embed_documents(texts),
+                context=context_block,
+                threshold=float(st.secrets.get("ROUTER_THRESHOLD", SIMILARITY_THRESHOLD))
+            )
+
+        # Keeps the per-turn prompt bounded (summaries are cached per session_id)
+        self.history = HistoryManager(
+            self.factory.llm,
+            budget=int(st.secrets.get("HISTORY_TOKEN_BUDGET", TOKEN_BUDGET))
+        )
+
+        self.build_seconds = time.perf_counter() - start
+        metrics.observe("agent_registry.build_seconds", self.build_seconds)
+
+
+@st.cache_resource(show_spinner="Waking up Mimi...")
+def _build_registry():
+    # Only runs on a cache miss (first use in this process)
+    metrics.incr("agent_registry.misses")
+    return AgentRegistry()
+
+
+def get_registry():
+    """
+    Returns the process-wide AgentRegistry, building it on first use.
+    """
+    metrics.incr("agent_registry.lookups")
+    return _build_registry()
+
+
+def cache_stats():
+    """
+    Build time and hit rate of the registry cache, for the debug panel.
+    """
+    lookups = metrics.counter("agent_registry.lookups")
+    misses = metrics.counter("agent_registry.misses")
+    return {
+        "build_seconds": _build_registry().build_seconds,
+        "lookups": lookups,
+        "hit_rate": (lookups - misses) / lookups if lookups else None,
+    }
@@ -0,0 +1,590 @@
+"""
+Deterministic local stand-ins for the services Mimi talks to.
+
+Nothing here opens a socket: every fake sleeps for a configurable latency
+instead, so timings show the app's own overhead plus a known, fixed cost
+per round trip.
+"""
+import asyncio
+import copy
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Seconds per round trip, overridden from the command line (see run.py)
+LATENCY = {
+    "llm": 0.05,        # per chat model call (time to first token)
+    "embed": 0.02,      # per embedding request
+    "db": 0.005,        # per Supabase request
+    "google": 0.02,     # per Google API request (a batch counts as one)
+}
+
+EMBEDDING_DIMENSIONS = 3072
+
+# Which tool the scripted model picks for which words in the question
+TOOL_KEYWORDS = {
+    "Calendar_Specialist": ("calendar", "schedule", "meeting"),
+    "list_upcoming_events": ("calendar", "schedule", "meeting"),
+    "Communication_Specialist": ("email", "inbox"),
+    "read_emails": ("email", "inbox"),
+    "Research_Specialist": ("news", "weather"),
+    "consult_knowledge_base": ("document", "report", "notes"),
+    "Knowledge_Specialist": ("document", "report", "notes"),
+}
+
+FILLER = ("Mimi went through everything and here is the short version of it. "
+          "Nothing needs your attention before tomorrow morning. ")
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+# --- CHAT MODEL (Groq) ---
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Stands in for ChatGroq. The "script" is a rule, not a recording:
+
+    - if the last message is a tool result, answer with a summary of the results;
+    - otherwise call every bound tool whose keywords appear in the question
+      (all in one step, so parallel tool calls happen like with the real model);
+    - otherwise answer directly.
+
+    Accepts (and ignores) ChatGroq's constructor arguments so it can be
+    swapped in for it.
+    """
+
+    model: str = "scripted"
+    api_key: str = ""
+    temperature: float = 0.0
+    max_tokens: int = 4096
+    latency: float = None
+    answer_chars: int = 600
+    tokens_per_chunk: int = 8
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(t, "name", None) or t.get("name") for t in tools]
+        return self.bind(tool_names=names)
+
+    def _delay(self):
+        return LATENCY["llm"] if self.latency is None else self.latency
+
+    def _respond(self, messages, tool_names):
+        last = messages[-1]
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+
+        if isinstance(last, ToolMessage):
+            results = []
+            for message in reversed(messages):
+                if not isinstance(message, ToolMessage):
+                    break
+                results.append(str(message.content)[:200])
+            text = "Here is what I found: " + " | ".join(reversed(results))
+        else:
+            words = set(_words(question))
+            calls = [
+                {"name": name, "args": self._args(name, question), "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+                for name in tool_names or []
+                if words & set(TOOL_KEYWORDS.get(name, ()))
+            ]
+            if calls:
+                return AIMessage(content="", tool_calls=calls)
+            text = f"You asked: {question[:120]}. "
+
+        text = (text + " " + FILLER * (self.answer_chars // len(FILLER) + 1))[:max(self.answer_chars, len(text))]
+        return AIMessage(content=text)
+
+    @staticmethod
+    def _args(name, question):
+        if name == "consult_knowledge_base":
+            return {"query": question}
+        if name == "read_emails":
+            return {"max_results": 5}
+        if name == "list_upcoming_events":
+            return {}
+        # Specialists are single-input Tools
+        return {"__arg1": question}
+
+    def _usage(self, messages, message):
+        prompt = sum(len(str(m.content)) for m in messages) // 4
+        completion = len(str(message.content)) // 4 + 10 * len(message.tool_calls or [])
+        return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+    def _result(self, messages, tool_names):
+        message = self._respond(messages, tool_names)
+        message.usage_metadata = self._usage(messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs):
+        time.sleep(self._delay())
+        return self._result(messages, tool_names)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._result(messages, tool_names)
+
+    def _chunks(self, messages, tool_names):
+        message = self._respond(messages, tool_names)
+        if message.tool_calls:
+            yield AIMessageChunk(content="", tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ], usage_metadata=self._usage(messages, message))
+            return
+        words = message.content.split(" ")
+        for i in range(0, len(words), self.tokens_per_chunk):
+            yield AIMessageChunk(content=" ".join(words[i:i + self.tokens_per_chunk]) + " ")
+        yield AIMessageChunk(content="", usage_metadata=self._usage(messages, message))
+
+    def _stream(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs):
+        time.sleep(self._delay())
+        for chunk in self._chunks(messages, tool_names):
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        for chunk in self._chunks(messages, tool_names):
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=chunk)
+
+
+# --- EMBEDDINGS (Gemini) ---
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words vectors: each word is hashed to a few
+    dimensions, so texts sharing words get similar vectors (good enough for
+    retrieval and the semantic cache to behave realistically).
+    Accepts (and ignores) GoogleGenerativeAIEmbeddings' arguments.
+    """
+
+    def __init__(self, dimensions=EMBEDDING_DIMENSIONS, **kwargs):
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def _vector(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in _words(text):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            for i in range(0, 8, 4):
+                slot = int.from_bytes(digest[i:i + 4], "little")
+                vector[slot % self.dimensions] += 1.0 if slot & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(LATENCY["embed"])
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        time.sleep(LATENCY["embed"])
+        return self._vector(text)
+
+
+# --- SUPABASE ---
+
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _split_top_level(text):
+    """
+    Splits a PostgREST logic expression on the commas that are not inside
+    parentheses or double quotes.
+    """
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+_OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+}
+
+
+def _column(row, column):
+    """
+    Value of a column, including jsonb paths like metadata->>source.
+    """
+    if "->>" in column:
+        field, key = column.split("->>", 1)
+        value = (row.get(field) or {}).get(key)
+        return None if value is None else str(value)
+    return row.get(column)
+
+
+def _parse_logic(expression):
+    """
+    PostgREST or=(...) / and(...) expression -> predicate(row).
+    Only what the app sends: column.op.value terms, nested and(...)/or(...).
+    """
+    terms = []
+    for part in _split_top_level(expression):
+        part = part.strip()
+        match = re.fullmatch(r"(and|or)\((.*)\)", part)
+        if match:
+            inner = _parse_logic(match.group(2))
+            if match.group(1) == "and":
+                terms.append(lambda row, inner=inner: all(p(row) for p in inner))
+            else:
+                terms.append(lambda row, inner=inner: any(p(row) for p in inner))
+            continue
+        column, op, value = part.split(".", 2)
+        value = value[1:-1] if value.startswith('"') and value.endswith('"') else value
+        terms.append(lambda row, c=column, o=_OPERATORS[op], v=value: o(*_comparable(_column(row, c), v)))
+    return terms
+
+
+def _comparable(column_value, literal):
+    # Numbers (e.g. bigint ids) compare as numbers, everything else as text
+    if isinstance(column_value, (int, float)) and not isinstance(column_value, bool):
+        try:
+            return column_value, type(column_value)(literal)
+        except ValueError:
+            pass
+    return _str(column_value), literal
+
+
+def _str(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+class _Query:
+    """
+    Chainable subset of postgrest-py's request builder.
+    """
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.columns = "*"
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.limit_count = None
+        self.offset = 0
+        self.count_mode = None
+
+    # --- actions ---
+    def select(self, columns="*", count=None):
+        self.action, self.columns, self.count_mode = "select", columns, count
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = "insert", rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict="id"):
+        self.action, self.payload = "upsert", rows if isinstance(rows, list) else [rows]
+        self.on_conflict = on_conflict
+        return self
+
+    def update(self, values):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    # --- filters ---
+    def eq(self, column, value):
+        self.filters.append(lambda row: _str(_column(row, column)) == _str(value))
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: _str(_column(row, column)) != _str(value))
+        return self
+
+    def in_(self, column, values):
+        values = {_str(v) for v in values}
+        self.filters.append(lambda row: _str(_column(row, column)) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: _OPERATORS["gt"](_str(_column(row, column)), _str(value)))
+        return self
+
+    def is_(self, column, value):
+        # Only "null" (IS NULL), what migrate_embeddings.py sends
+        self.filters.append(lambda row: _column(row, column) is None)
+        return self
+
+    def or_(self, expression):
+        terms = _parse_logic(expression)
+        self.filters.append(lambda row: any(term(row) for term in terms))
+        return self
+
+    # --- shaping ---
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def range(self, start, end):
+        self.offset, self.limit_count = start, end - start + 1
+        return self
+
+    def _project(self, row):
+        if self.columns.strip() == "*":
+            return copy.deepcopy(row)
+        out = {}
+        for column in (c.strip() for c in self.columns.split(",")):
+            name = column.split("->>")[-1]
+            out[name] = copy.deepcopy(_column(row, column))
+        return out
+
+    def execute(self):
+        time.sleep(LATENCY["db"])
+        self.db.requests += 1
+        with self.db.lock:
+            return self.db.apply(self)
+
+
+class FakeSupabase:
+    """
+    In-memory Supabase client: chat_history, chat_sessions (maintained like the
+    triggers in migrations/001_chat_sessions.sql), documents, and the
+    match_documents RPC.
+    """
+
+    def __init__(self):
+        self.tables = {"chat_history": [], "chat_sessions": [], "documents": []}
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.requests = 0
+        self.parsed = {}
+        self.clock = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def table(self, name):
+        self.tables.setdefault(name, [])
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        if name != "match_documents":
+            raise ValueError(f"Unknown RPC {name}")
+        db = self
+
+        class _Call:
+            def execute(self):
+                time.sleep(LATENCY["db"])
+                db.requests += 1
+                with db.lock:
+                    return _Response(db.match_documents(**params))
+        return _Call()
+
+    # --- executing queries ---
+    def apply(self, query):
+        rows = self.tables[query.table]
+        if query.action in ("insert", "upsert"):
+            return _Response(self._write(query.table, query.payload, upsert=query.action == "upsert",
+                                         key=getattr(query, "on_conflict", "id")))
+
+        matched = [row for row in rows if all(f(row) for f in query.filters)]
+        if query.action == "delete":
+            gone = {id(row) for row in matched}
+            self.tables[query.table] = [row for row in rows if id(row) not in gone]
+            if query.table == "chat_history":
+                self._sessions_on_delete(matched)
+            return _Response(matched)
+        if query.action == "update":
+            for row in matched:
+                row.update(query.payload)
+            return _Response(matched)
+
+        for column, desc in reversed(query.orders):
+            matched.sort(key=lambda row: (_column(row, column) is None, _column(row, column)), reverse=desc)
+        count = len(matched) if query.count_mode else None
+        end = None if query.limit_count is None else query.offset + query.limit_count
+        return _Response([query._project(row) for row in matched[query.offset:end]], count)
+
+    def _write(self, table, payload, upsert, key="id"):
+        rows = self.tables[table]
+        by_id = {row.get(key): row for row in rows} if upsert else {}
+        written = []
+        for new in payload:
+            new = copy.deepcopy(new)
+            if table == "chat_history":
+                new.setdefault("id", next(self.ids))
+                if not new.get("created_at"):
+                    self.clock += timedelta(milliseconds=1)
+                    new["created_at"] = self.clock.isoformat()
+            if upsert and new.get(key) in by_id:
+                by_id[new[key]].update(new)
+            else:
+                rows.append(new)
+                by_id[new.get(key)] = new
+            written.append(new)
+            if table == "chat_history":
+                self._sessions_on_insert(new)
+        return written
+
+    def _sessions_on_insert(self, message):
+        sessions = self.tables["chat_sessions"]
+        key = str(message["session_id"])
+        for row in sessions:
+            if row["id"] == key:
+                row["last_activity"] = max(row["last_activity"], message["created_at"])
+                row["message_count"] += 1
+                return
+        sessions.append({
+            "id": key,
+            "title": message["content"][:30] + "...",
+            "last_activity": message["created_at"],
+            "message_count": 1,
+        })
+
+    def _sessions_on_delete(self, messages):
+        counts = {}
+        for message in messages:
+            counts[str(message["session_id"])] = counts.get(str(message["session_id"]), 0) + 1
+        keep = []
+        for row in self.tables["chat_sessions"]:
+            row["message_count"] -= counts.get(row["id"], 0)
+            if row["message_count"] > 0:
+                keep.append(row)
+        self.tables["chat_sessions"] = keep
+
+    def _vector(self, value):
+        # pgvector text literals ("[0.1,...]"), parsed once per distinct string
+        if not isinstance(value, str):
+            return np.asarray(value, dtype=np.float32)
+        vector = self.parsed.get(value)
+        if vector is None:
+            vector = self.parsed[value] = np.asarray(json.loads(value), dtype=np.float32)
+        return vector
+
+    def match_documents(self, query_embedding, match_threshold=0.0, match_count=5, **kwargs):
+        rows = self.tables["documents"]
+        if not rows:
+            return []
+        matrix = np.asarray([self._vector(row["embedding"]) for row in rows], dtype=np.float32)
+        query = self._vector(query_embedding)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+        order = np.argsort(-scores)[:match_count]
+        return [
+            {"id": rows[i]["id"], "content": rows[i]["content"], "metadata": copy.deepcopy(rows[i]["metadata"]),
+             "similarity": float(scores[i])}
+            for i in order if scores[i] > match_threshold
+        ]
+
+
+# --- GOOGLE (Calendar / Gmail) ---
+
+class _Request:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        time.sleep(LATENCY["google"])
+        return self.result() if callable(self.result) else self.result
+
+
+class _Batch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        # One round trip for the whole batch
+        time.sleep(LATENCY["google"])
+        for request_id, request in self.requests:
+            result = request.result() if callable(request.result) else request.result
+            self.callback(request_id, result, None)
+
+
+class _Resource:
+    def __init__(self, **methods):
+        self.methods = methods
+
+    def __getattr__(self, name):
+        try:
+            return self.methods[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakeGoogleService:
+    """
+    Just the Calendar and Gmail calls tools_library makes.
+    """
+
+    def __init__(self, api, events=10, unread=5):
+        self.api = api
+        start = datetime(2025, 1, 6, 9, tzinfo=timezone.utc)
+        self.calendar = [
+            {"id": f"evt{i}", "summary": f"Meeting {i}", "start": {"dateTime": (start + timedelta(hours=i)).isoformat()}}
+            for i in range(events)
+        ]
+        self.inbox = [
+            {"id": f"msg{i}", "snippet": f"Quick question number {i} about the report",
+             "payload": {"headers": [{"name": "Subject", "value": f"Question {i}"},
+                                     {"name": "From", "value": f"colleague{i}@example.com"}]}}
+            for i in range(unread)
+        ]
+
+    def events(self):
+        return _Resource(
+            list=lambda **kw: _Request({"items": self.calendar[:kw.get("maxResults", 10)]}),
+            insert=lambda **kw: _Request({"id": "evt-new", "htmlLink": "https://calendar.example/evt-new"}),
+        )
+
+    def users(self):
+        messages = _Resource(
+            list=lambda **kw: _Request({"messages": [{"id": m["id"]} for m in self.inbox[:kw.get("maxResults", 5)]]}),
+            get=lambda **kw: _Request(lambda: next(m for m in self.inbox if m["id"] == kw["id"])),
+            send=lambda **kw: _Request({"id": "sent-1"}),
+        )
+        return _Resource(messages=lambda: messages)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(callback)
@@ -0,0 +1,150 @@
+"""
+Wires the fakes into the app and measures scenarios.
+
+install() runs before any app module is imported: a few of them read
+st.secrets at import time. Clients are swapped through clients.override().
+"""
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from bench import fakes
+
+SECRETS = {
+    "GROQ_API_KEY": "bench",
+    "GEMINI_API_KEY": "bench",
+    "SUPABASE_URL": "http://supabase.bench.local",
+    "SUPABASE_KEY": "bench",
+    "GOOGLE_TOKEN": "{}",
+    # Every repetition should do the full work, not replay a cached answer
+    "SEMANTIC_CACHE": False,
+    # The fakes have no quota; the scheduler's overhead is still measured
+    "GROQ_RPM": 1_000_000,
+    "GROQ_TPM": 1_000_000_000,
+}
+
+_installed = None
+
+
+def install(secrets=None):
+    """
+    Points every external client of the app at the fakes and returns the
+    shared FakeSupabase. Safe to call more than once.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    # Cold, private caches (embeddings, local index, journal spill, traces)
+    os.environ.setdefault("MIMI_CACHE_DIR", tempfile.mkdtemp(prefix="mimi-bench-"))
+
+    import streamlit as st
+    st.secrets = {**SECRETS, **(secrets or {})}
+
+    database = fakes.FakeSupabase()
+    import clients
+    clients.override(supabase=database, gemini_embeddings=fakes.HashEmbeddings())
+
+    import langchain_groq
+    langchain_groq.ChatGroq = fakes.ScriptedChatModel
+
+    import google_services
+    services = {}
+    google_services.get_service = lambda token_json, api, version: services.setdefault(api, fakes.FakeGoogleService(api))
+
+    _installed = database
+    return database
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """
+    Collects latency samples for one scenario, by label.
+    """
+
+    def __init__(self):
+        self.samples = {}   # label -> [(seconds, ops)]
+
+    @contextmanager
+    def sample(self, label, ops=1):
+        start = time.perf_counter()
+        yield
+        self.samples.setdefault(label, []).append((time.perf_counter() - start, ops))
+
+    def rows(self, scenario, peak_bytes):
+        rows = []
+        for label, samples in self.samples.items():
+            seconds = [s for s, _ in samples]
+            total = sum(seconds)
+            rows.append({
+                "scenario": scenario,
+                "label": label,
+                "n": len(samples),
+                "p50": percentile(seconds, 50),
+                "p95": percentile(seconds, 95),
+                "mean": statistics.fmean(seconds),
+                "throughput": sum(ops for _, ops in samples) / total if total else None,
+                "peak_mb": peak_bytes / 2**20 if peak_bytes is not None else None,
+            })
+        return rows
+
+
+def measure(name, scenario, context, memory=True):
+    """
+    Runs one scenario and returns its report rows.
+    Peak memory comes from tracemalloc (Python allocations only, and it slows
+    Python code down a little; pass memory=False for the cleanest timings).
+    """
+    recorder = Recorder()
+    if memory:
+        tracemalloc.start()
+    try:
+        scenario(context, recorder)
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return recorder.rows(name, peak)
+
+
+def _fmt(value, unit=""):
+    if value is None:
+        return "-"
+    if unit == "ms":
+        return f"{value * 1000:.1f}"
+    return f"{value:.1f}"
+
+
+def format_report(rows):
+    header = f"{'scenario':<22} {'measure':<24} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'ops/s':>9} {'peak MB':>8}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['scenario']:<22} {row['label']:<24} {row['n']:>5} "
+            f"{_fmt(row['p50'], 'ms'):>9} {_fmt(row['p95'], 'ms'):>9} "
+            f"{_fmt(row['throughput']):>9} {_fmt(row['peak_mb']):>8}"
+        )
+    return "\n".join(lines)
+
+
+def regressions(rows, baseline, tolerance):
+    """
+    Measures whose p95 got more than `tolerance` (0.2 = 20%) slower than in
+    the baseline report.
+    """
+    previous = {(r["scenario"], r["label"]): r for r in baseline}
+    slower = []
+    for row in rows:
+        old = previous.get((row["scenario"], row["label"]))
+        if old and old["p95"] and row["p95"] > old["p95"] * (1 + tolerance):
+            slower.append(f"{row['scenario']} / {row['label']}: p95 {old['p95'] * 1000:.1f} -> {row['p95'] * 1000:.1f} ms")
+    return slower
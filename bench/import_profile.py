@@ -0,0 +1,87 @@
+"""
+Import-time profile of the app's startup path (python -X importtime).
+
+    python -m bench.import_profile            # what importing the app costs
+    python -m bench.import_profile --top 30
+
+Runs in a fresh interpreter, imports streamlit first (the runtime has it
+loaded before our script starts), then the app modules, and reports how long
+each app module took including everything it pulled in, the heaviest
+packages, and the peak RSS of the process.
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+# What `streamlit run agent.py` imports before the first paint
+APP_MODULES = ["db", "rag_manager", "agent_registry", "semantic_cache", "streaming",
+               "embedding_cache", "tool_executor", "metrics", "tracing"]
+
+CHILD = """
+import resource, sys
+import streamlit as st
+st.secrets = {{"GROQ_API_KEY": "profile", "SEMANTIC_CACHE": False}}
+{imports}
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+print(",".join(sorted(m.split(".")[0] for m in sys.modules)))
+"""
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile(modules):
+    code = CHILD.format(imports="\n".join(f"import {m}" for m in modules))
+    done = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True)
+    if done.returncode != 0:
+        raise SystemExit(done.stderr[-2000:])
+
+    entries = []
+    for line in done.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    rss_kb, loaded = done.stdout.split()
+    return entries, int(rss_kb), set(loaded.split(","))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time profile of the app")
+    parser.add_argument("--top", type=int, default=15, help="heaviest packages to list")
+    parser.add_argument("modules", nargs="*", default=APP_MODULES)
+    args = parser.parse_args(argv)
+
+    entries, rss_kb, loaded = profile(args.modules)
+
+    # Top-level entries are the imports the child itself did (streamlit, then ours)
+    top = {name: cumulative for name, _, cumulative, depth in entries if depth == 0}
+    streamlit_ms = top.get("streamlit", 0) / 1000
+    app_ms = sum(top.get(m, 0) for m in args.modules) / 1000
+
+    print(f"{'module':<24} {'cumulative ms':>14}")
+    for module in args.modules:
+        print(f"{module:<24} {top.get(module, 0) / 1000:>14.1f}")
+    print(f"{'(app total)':<24} {app_ms:>14.1f}")
+    print(f"{'(streamlit itself)':<24} {streamlit_ms:>14.1f}")
+
+    # Self time per top-level package, for what was imported after streamlit
+    start = next((i for i, e in enumerate(entries) if e[0] == "streamlit" and e[3] == 0), -1) + 1
+    packages = {}
+    for name, self_us, _, _ in entries[start:]:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print(f"\nHeaviest packages imported by the app (self time):")
+    for package, micros in sorted(packages.items(), key=lambda p: -p[1])[:args.top]:
+        print(f"  {package:<30} {micros / 1000:>8.1f} ms")
+
+    heavy = [p for p in ("langchain_google_genai", "langchain_community", "googleapiclient", "supabase", "pypdf", "langchain_groq")
+             if p in loaded]
+    print(f"\nDeferred clients imported at startup: {', '.join(heavy) or 'none'}")
+    print(f"Peak RSS after import: {rss_kb / 1024:.0f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Offline benchmark: no API keys, no network.
+
+    python -m bench.run                              # every scenario
+    python -m bench.run multi_tool_turn --repeat 20
+    python -m bench.run --llm-latency 0.4 --json after.json --baseline before.json
+
+Exits with status 1 when --baseline is given and a p95 got slower than
+--tolerance allows, so it can gate a merge.
+"""
+import argparse
+import json
+import sys
+
+from bench import fakes, harness
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mimi offline benchmark")
+    parser.add_argument("scenarios", nargs="*", help="scenario names (default: all)")
+    parser.add_argument("--repeat", type=int, default=10, help="repetitions of each measured step")
+    parser.add_argument("--llm-latency", type=float, default=fakes.LATENCY["llm"])
+    parser.add_argument("--embed-latency", type=float, default=fakes.LATENCY["embed"])
+    parser.add_argument("--db-latency", type=float, default=fakes.LATENCY["db"])
+    parser.add_argument("--google-latency", type=float, default=fakes.LATENCY["google"])
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (cleaner timings)")
+    parser.add_argument("--json", help="write the report rows to this file")
+    parser.add_argument("--baseline", help="report from an earlier --json run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    fakes.LATENCY.update(llm=args.llm_latency, embed=args.embed_latency, db=args.db_latency, google=args.google_latency)
+    database = harness.install()
+
+    # Only after install(): some app modules read st.secrets on import
+    from bench.scenarios import SCENARIOS
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    context = {"db": database, "repeat": args.repeat}
+    rows = []
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        rows += harness.measure(name, SCENARIOS[name], context, memory=not args.no_memory)
+
+    print(harness.format_report(rows))
+    print(f"\nLatency per round trip: {fakes.LATENCY}  |  Supabase requests: {database.requests}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"latency": fakes.LATENCY, "rows": rows}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            slower = harness.regressions(rows, json.load(f)["rows"], args.tolerance)
+        if slower:
+            print("\nRegressions:\n  " + "\n  ".join(slower))
+            return 1
+        print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Standard scenarios. Each one is f(context, recorder): it prepares what it
+needs, then records samples with recorder.sample(label, ops).
+
+context is a dict shared by all scenarios of a run:
+    "db":       the FakeSupabase behind db.py, rag_manager.py and ingestion.py
+    "repeat":   how many times to repeat the measured step
+"""
+import uuid
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+
+LOREM = ("The quarterly report covers the budget, the hiring plan and the travel policy. "
+         "Project Alpha ships in March; Project Beta needs two more engineers. "
+         "Destinations the team liked: Lisbon, Kyoto, Vancouver. ")
+
+
+def _registry(context):
+    # Built once per run, like get_registry() does once per process
+    if "registry" not in context:
+        from agent_registry import AgentRegistry
+        context["registry"] = AgentRegistry()
+    return context["registry"]
+
+
+def _pages(count, salt="", chars=2500):
+    """
+    Synthetic PDF pages: realistic length, enough variety that chunks differ.
+    """
+    pages = []
+    for number in range(count):
+        head = f"Page {number + 1} of the handbook {salt}. Section {number % 17}, item {number * 7 % 101}. "
+        body = (head + LOREM) * (chars // (len(head) + len(LOREM)) + 1)
+        pages.append(Document(page_content=body[:chars], metadata={"page": number}))
+    return pages
+
+
+def _seed_documents(context, pages=20):
+    if context.get("documents_seeded"):
+        return
+    import clients
+    import ingestion
+    ingestion.run(
+        pages=_pages(pages, salt="seed"),
+        embed_documents=clients.embeddings().embed_documents,
+        supabase_client=context["db"],
+        source="handbook.pdf",
+        doc_hash="seed",
+        total_pages=pages,
+    )
+    context["documents_seeded"] = True
+
+
+def _ask(registry, messages):
+    import tool_executor
+    return tool_executor.run(lambda: registry.mimi.ainvoke({"messages": messages}))
+
+
+def single_question(context, recorder):
+    """
+    One root-agent turn that needs no tools (one model call).
+    """
+    registry = _registry(context)
+    for i in range(context["repeat"]):
+        with recorder.sample("turn"):
+            _ask(registry, [HumanMessage(content=f"Tell me something nice, take {i}")])
+
+
+def multi_tool_turn(context, recorder):
+    """
+    One turn that fans out to the Calendar and Communication specialists and
+    the knowledge base in parallel (each specialist calls its own tool).
+    """
+    registry = _registry(context)
+    _seed_documents(context)
+    question = "What is on my calendar, anything new in my email inbox, and what does the report say about the budget?"
+    for i in range(context["repeat"]):
+        with recorder.sample("turn"):
+            _ask(registry, [HumanMessage(content=f"{question} ({i})")])
+
+
+def routed_turn(context, recorder):
+    """
+    Requests the intent router answers without the root agent, against the
+    full agent for the same questions (4 model calls -> 1).
+    """
+    registry = _registry(context)
+    _seed_documents(context)
+    questions = ["What's on my calendar?", "Check my inbox", "What do my documents say about the report?"]
+    for i in range(context["repeat"]):
+        history = [HumanMessage(content=questions[i % len(questions)])]
+        with recorder.sample("routed"):
+            route = registry.router.route(history[-1].content)
+            if route:
+                "".join(registry.router.run(route, history))
+            else:
+                _ask(registry, history)
+        with recorder.sample("full agent"):
+            _ask(registry, history)
+
+
+def ingest_200_pages(context, recorder):
+    """
+    The ingestion pipeline on a 200-page document (throughput in pages/s).
+    A new document every time so nothing is skipped as already stored.
+    """
+    import clients
+    import ingestion
+    for i in range(max(1, context["repeat"] // 5)):
+        pages = _pages(200, salt=uuid.uuid4().hex)
+        with recorder.sample("ingest", ops=len(pages)):
+            ingestion.run(
+                pages=iter(pages),
+                embed_documents=clients.embeddings().embed_documents,
+                supabase_client=context["db"],
+                source=f"bench-{i}.pdf",
+                doc_hash=str(i),
+                total_pages=len(pages),
+            )
+
+
+def sidebar_1k_sessions(context, recorder):
+    """
+    Sidebar with 1,000 stored sessions: the first page (every rerun) and
+    paging through all of them with "Load more".
+    """
+    import db
+    if not context.get("sessions_seeded"):
+        rows = []
+        for s in range(1000):
+            session_id = str(uuid.uuid4())
+            for role, text in (("user", f"Question {s} about the trip"), ("assistant", "Answer " + LOREM)) * 2:
+                rows.append({"session_id": session_id, "role": role, "content": text})
+        for i in range(0, len(rows), 500):
+            db.save_messages(rows[i:i + 500])
+        context["sessions_seeded"] = True
+
+    for _ in range(context["repeat"]):
+        with recorder.sample("first page"):
+            db.get_sessions_page()
+
+    pages, cursor = 0, None
+    with recorder.sample("all pages", ops=1000):
+        while True:
+            _, cursor = db.get_sessions_page(cursor=cursor)
+            pages += 1
+            if cursor is None:
+                break
+
+
+def open_long_session(context, recorder):
+    """
+    Opening a 5,000-message chat from the sidebar: the newest page (what
+    agent.py loads), paging back with "Load earlier messages", and the old
+    load-everything path for comparison.
+    """
+    import db
+    session_id = context.setdefault("long_session", str(uuid.uuid4()))
+    if not context.get("long_session_seeded"):
+        rows = [{"session_id": session_id, "role": "user" if i % 2 == 0 else "assistant",
+                 "content": f"Message {i}. " + LOREM} for i in range(5000)]
+        for i in range(0, len(rows), 500):
+            db.save_messages(rows[i:i + 500])
+        context["long_session_seeded"] = True
+
+    for _ in range(context["repeat"]):
+        with recorder.sample("newest page"):
+            _, cursor = db.get_messages_page(session_id)
+    with recorder.sample("load earlier", ops=10):
+        for _ in range(10):
+            _, cursor = db.get_messages_page(session_id, before=cursor)
+    for _ in range(max(1, context["repeat"] // 5)):
+        with recorder.sample("all messages"):
+            db.get_messages(session_id)
+
+
+def conversation_50_turns(context, recorder):
+    """
+    50 turns in one session, the way agent.py runs them: history bounding,
+    the root agent, and journaled writes. Late turns show what the growing
+    history costs (summaries kick in once it passes the token budget).
+    """
+    import db
+    registry = _registry(context)
+    session_id = str(uuid.uuid4())
+    messages = []
+    journal = db.get_journal()
+    for turn in range(50):
+        question = f"Turn {turn}: remind me what we said about the plan, and add a detail. " + LOREM
+        with recorder.sample("turn"):
+            messages.append(HumanMessage(content=question))
+            journal.append(session_id, "user", question)
+            history = registry.history.prepare(session_id, messages)
+            answer = _ask(registry, history)["messages"][-1].content
+            messages.append(AIMessage(content=answer))
+            journal.append(session_id, "assistant", answer)
+    with recorder.sample("journal flush"):
+        journal.flush()
+
+
+SCENARIOS = {
+    "single_question": single_question,
+    "multi_tool_turn": multi_tool_turn,
+    "routed_turn": routed_turn,
+    "ingest_200_pages": ingest_200_pages,
+    "sidebar_1k_sessions": sidebar_1k_sessions,
+    "open_long_session": open_long_session,
+    "conversation_50_turns": conversation_50_turns,
+}
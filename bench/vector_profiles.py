@@ -0,0 +1,136 @@
+"""
+Recall vs latency of the embedding profiles (EMBEDDING_DIMENSIONS x
+VECTOR_STORAGE) on a synthetic benchmark corpus, through the real LocalIndex.
+Offline, like bench.run.
+
+    python -m bench.vector_profiles
+    python -m bench.vector_profiles --chunks 20000 --queries 300 --k 5
+
+Ground truth is the exact top-k at 3072 dimensions in float32. Vectors are
+HashEmbeddings spread over all dimensions by a fixed random rotation, so a
+prefix is a random projection: truncation recall here is a lower bound, a
+Matryoshka-trained model (gemini-embedding-001) keeps more in its first
+dimensions.
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench import fakes, harness
+from bench.scenarios import LOREM
+
+DIMENSIONS = (3072, 1536, 768)
+STORAGES = ("float32", "int8", "binary")
+
+
+def _corpus(chunks, seed=0, words_per_chunk=150):
+    """
+    Chunks of Zipf-distributed words: a few very common ones, a long tail of
+    rare ones, like real documents.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = LOREM.lower().replace(".", "").replace(",", "").replace(";", "").replace(":", "").split()
+    vocabulary += [f"term{i}" for i in range(5000)]
+    ranks = np.minimum(rng.zipf(1.3, size=(chunks, words_per_chunk)), len(vocabulary)) - 1
+    return [" ".join(vocabulary[r] for r in row) for row in ranks]
+
+
+def _queries(texts, count, seed=1, words=8):
+    """
+    A handful of words from a random chunk, like a user asking about it.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.choice(len(texts), count, replace=False):
+        tokens = texts[i].split()
+        queries.append(" ".join(rng.choice(tokens, min(words, len(tokens)), replace=False)))
+    return queries
+
+
+def _embed(texts, rotation):
+    vectors = np.asarray(fakes.HashEmbeddings().embed_documents(texts), dtype=np.float32)
+    dense = vectors @ rotation
+    return dense / np.linalg.norm(dense, axis=1, keepdims=True)
+
+
+def _exact_top(vectors, queries, k):
+    scores = queries @ vectors.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def run(chunks=5000, queries=200, k=5, seed=0):
+    """
+    One report row per profile: recall@k against the full-size ground truth,
+    search latency, and bytes per vector (scanned in memory / sent to Supabase).
+    """
+    from local_index import LocalIndex
+    import vector_profile
+
+    rng = np.random.default_rng(seed)
+    rotation, _ = np.linalg.qr(rng.standard_normal((fakes.EMBEDDING_DIMENSIONS, fakes.EMBEDDING_DIMENSIONS)))
+    rotation = rotation.astype(np.float32)
+
+    texts = _corpus(chunks, seed)
+    print(f"Embedding {chunks} chunks and {queries} queries...", file=sys.stderr)
+    vectors = _embed(texts, rotation)
+    query_vectors = _embed(_queries(texts, queries, seed + 1), rotation)
+    truth = _exact_top(vectors, query_vectors, k)
+    rows = [{"id": str(i), "content": text, "metadata": {}, "embedding": vector}
+            for i, (text, vector) in enumerate(zip(texts, vectors))]
+
+    report = []
+    for dimensions in DIMENSIONS:
+        payload = len(vector_profile.to_pgvector(vector_profile.truncate(vectors[0], dimensions)))
+        for storage in STORAGES:
+            print(f"  {dimensions} x {storage}", file=sys.stderr)
+            with tempfile.TemporaryDirectory() as directory:
+                index = LocalIndex(directory, use_ivf=False, dimensions=dimensions, storage=storage)
+                index.apply(rows, [])
+                latencies, hits = [], 0
+                for query, expected in zip(query_vectors, truth):
+                    started = time.perf_counter()
+                    found = index.search(query, k=k)
+                    latencies.append(time.perf_counter() - started)
+                    hits += len(expected & {int(row["id"]) for row in found})
+                scanned = index.codes if index.codes is not None else index.vectors
+                report.append({
+                    "dimensions": dimensions,
+                    "storage": storage,
+                    "recall": hits / (k * len(truth)),
+                    "p50_ms": harness.percentile(latencies, 50) * 1000,
+                    "p95_ms": harness.percentile(latencies, 95) * 1000,
+                    "memory_bytes": scanned.nbytes // chunks,
+                    "payload_bytes": payload,
+                })
+                del index, scanned
+    return report
+
+
+def format_report(report, k):
+    lines = [f"{'profile':<16} {f'recall@{k}':>9} {'p50 ms':>8} {'p95 ms':>8} {'B/vector':>9} {'B/request':>10}"]
+    for row in report:
+        lines.append(f"{row['dimensions']:>4} x {row['storage']:<9} {row['recall']:>9.3f} {row['p50_ms']:>8.2f} "
+                     f"{row['p95_ms']:>8.2f} {row['memory_bytes']:>9} {row['payload_bytes']:>10}")
+    lines.append("B/vector: what a search scans in memory (quantized codes, or the float32 matrix).")
+    lines.append("B/request: the vector as sent to Supabase (pgvector literal), per chunk stored or query.")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall vs latency of the embedding profiles")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    fakes.LATENCY["embed"] = 0.0
+    print(format_report(run(args.chunks, args.queries, args.k, args.seed), args.k))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import threading
+
+import streamlit as st
+
+# --- CONFIGURATION ---
+# Using the model you have available (3072 dimensions)
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+# Dimensions actually used (768 / 1536 / 3072), EMBEDDING_DIMENSIONS secret.
+# Changing it needs migrations/002_compact_embeddings.sql + migrate_embeddings.py first.
+
+# Clients are created on first use, not at import time: the first paint
+# doesn't wait for supabase/langchain_google_genai to import or connect.
+_lock = threading.RLock()   # embeddings() creates gemini_embeddings() while holding it
+_clients = {}
+
+
+def _get(name, create):
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = create()
+        return client
+
+
+def override(**clients):
+    """
+    Replaces clients before anything uses them (the offline bench, tests):
+        override(supabase=fake_client, gemini_embeddings=fake_embeddings)
+    """
+    with _lock:
+        _clients.update(clients)
+
+
+def supabase():
+    """
+    The one Supabase client of the process, shared by db.py, rag_manager.py
+    and ingestion (one HTTP connection pool instead of one per module).
+    """
+    def create():
+        from supabase import create_client
+        return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+    return _get("supabase", create)
+
+
+def gemini_embeddings():
+    """
+    The raw Gemini embeddings client (use embeddings() for the cached one).
+    """
+    def create():
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=st.secrets["GEMINI_API_KEY"])
+    return _get("gemini_embeddings", create)
+
+
+def embedding_dimensions():
+    from vector_profile import DIMENSIONS, FULL_DIMENSIONS
+    dimensions = int(st.secrets.get("EMBEDDING_DIMENSIONS", FULL_DIMENSIONS))
+    if dimensions not in DIMENSIONS:
+        raise ValueError(f"EMBEDDING_DIMENSIONS must be one of {DIMENSIONS}, got {dimensions}")
+    return dimensions
+
+
+def embeddings():
+    """
+    Gemini embeddings behind the two-tier cache: repeated queries and chunks skip the API.
+    Truncated to embedding_dimensions() after the cache, which keeps full vectors.
+    """
+    def create():
+        from embedding_cache import CachedEmbeddings
+        from vector_profile import FULL_DIMENSIONS, TruncatedEmbeddings
+        cached = CachedEmbeddings(gemini_embeddings(), model=EMBEDDING_MODEL)
+        dimensions = embedding_dimensions()
+        return cached if dimensions == FULL_DIMENSIONS else TruncatedEmbeddings(cached, dimensions)
+    return _get("embeddings", create)
+
+
+def embed_query(text: str):
+    """
+    Shortcut for callers that hold on to a function (e.g. SemanticCache):
+    the client is still only created on the first call.
+    """
+    return embeddings().embed_query(text)
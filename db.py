@@ -1,51 +1,73 @@
 import streamlit as st
-from supabase import create_client
 import uuid
 
-# Initialize Supabase Client
-# We use st.cache_resource so we don't reconnect every time you click a button
-@st.cache_resource
+import clients
+from message_journal import MessageJournal
+import tracing
+
+# Supabase client: created on first use and shared with rag_manager (see clients.py)
 def get_supabase_client():
-    return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+    return clients.supabase()
 
-supabase = get_supabase_client()
+SESSIONS_PAGE_SIZE = 20
+MESSAGES_PAGE_SIZE = 50
 
-def get_all_sessions():
+@tracing.traced("supabase chat_sessions.page")
+def get_sessions_page(limit=SESSIONS_PAGE_SIZE, cursor=None):
     """
-    Fetches a list of unique chat sessions.
+    Fetches one page of chat sessions, most recent first.
+
+    Reads the chat_sessions summary table (kept up to date by the triggers in
+    migrations/001_chat_sessions.sql) with keyset pagination, so the cost depends
+    on the page size and not on how much history is stored.
+
+    cursor: the value returned by the previous call (None for the first page).
+    Returns (sessions, next_cursor); next_cursor is None on the last page.
     """
     try:
-        # We group by session_id and take the first message to get the 'title'
-        # Note: This is a simple query. For a real app, you might want a separate 'sessions' table.
-        # Here we just grab distinct session_ids from the history.
-        response = supabase.table("chat_history")\
-            .select("session_id, content, created_at")\
-            .order("created_at", desc=True)\
-            .execute()
-            
-        # Quick logic to get unique sessions and a preview title
-        seen = set()
-        sessions = []
-        for row in response.data:
-            sid = row['session_id']
-            if sid not in seen:
-                sessions.append({
-                    "id": sid,
-                    "title": row['content'][:30] + "..." # Use first 30 chars of latest msg as title
-                })
-                seen.add(sid)
-        return sessions
+        query = clients.supabase().table("chat_sessions")\
+            .select("id, title, last_activity, message_count")\
+            .order("last_activity", desc=True)\
+            .order("id", desc=True)\
+            .limit(limit + 1)
+
+        if cursor:
+            last_activity, last_id = cursor
+            # (last_activity, id) < cursor, spelled out for PostgREST
+            query = query.or_(
+                f'last_activity.lt."{last_activity}",'
+                f'and(last_activity.eq."{last_activity}",id.lt."{last_id}")'
+            )
+
+        rows = query.execute().data
+        # We asked for one extra row just to know if there is a next page
+        sessions = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = (sessions[-1]["last_activity"], sessions[-1]["id"])
+        return sessions, next_cursor
     except Exception as e:
         print(f"Error fetching sessions: {e}")
-        return []
+        return [], None
+
+def _older_than(query, before):
+    """
+    Keyset filter: rows before the (created_at, id) cursor.
+    """
+    created_at, last_id = before
+    return query.or_(
+        f'created_at.lt."{created_at}",'
+        f'and(created_at.eq."{created_at}",id.lt.{last_id})'
+    )
 
+@tracing.traced("supabase chat_history.select")
 def get_messages(session_id):
     """
-    Loads all messages for a specific chat.
+    Loads all messages for a specific chat (prefer get_messages_page for the UI).
     """
     try:
-        response = supabase.table("chat_history")\
-            .select("*")\
+        response = clients.supabase().table("chat_history")\
+            .select("role, content, created_at")\
             .eq("session_id", session_id)\
             .order("created_at", desc=False)\
             .execute()
@@ -53,6 +75,39 @@ def get_messages(session_id):
     except Exception as e:
         return []
 
+@tracing.traced("supabase chat_history.page")
+def get_messages_page(session_id, limit=MESSAGES_PAGE_SIZE, before=None):
+    """
+    Fetches one page of a chat's messages, newest page first, returned in
+    chronological order. Keyset pagination on (created_at, id) like
+    get_sessions_page, so opening a long chat costs one page, not the whole
+    history; only the columns the UI needs are read.
+
+    before: the cursor returned by the previous call (None for the newest page).
+    Returns (messages, before_cursor); before_cursor is None when nothing older is left.
+    """
+    try:
+        query = clients.supabase().table("chat_history")\
+            .select("id, role, content, created_at")\
+            .eq("session_id", session_id)\
+            .order("created_at", desc=True)\
+            .order("id", desc=True)\
+            .limit(limit + 1)
+
+        if before:
+            query = _older_than(query, before)
+
+        rows = query.execute().data
+        messages = rows[:limit]
+        before_cursor = None
+        if len(rows) > limit:
+            before_cursor = (messages[-1]["created_at"], messages[-1]["id"])
+        messages.reverse()
+        return messages, before_cursor
+    except Exception as e:
+        print(f"Error fetching messages: {e}")
+        return [], None
+
 def save_message(session_id, role, content):
     """
     Saves a single message to the cloud.
@@ -63,15 +118,34 @@ def save_message(session_id, role, content):
             "role": role,
             "content": content
         }
-        supabase.table("chat_history").insert(data).execute()
+        clients.supabase().table("chat_history").insert(data).execute()
     except Exception as e:
         print(f"Error saving message: {e}")
 
+@tracing.traced("supabase chat_history.insert")
+def save_messages(rows):
+    """
+    Inserts several messages in one request. Raises on failure
+    (the journal below decides whether to retry or spill).
+    """
+    clients.supabase().table("chat_history").insert(rows).execute()
+
+@st.cache_resource
+def get_journal():
+    """
+    Process-wide write-behind journal for chat_history: append() returns
+    immediately, rows are inserted in batches by a background thread.
+    """
+    return MessageJournal(save_messages)
+
+@tracing.traced("supabase chat_history.delete")
 def delete_session(session_id):
     """
     Wipes a chat history.
     """
     try:
-        supabase.table("chat_history").delete().eq("session_id", session_id).execute()
+        clients.supabase().table("chat_history").delete().eq("session_id", session_id).execute()
+        # The delete trigger already drops the summary row, this is just belt and braces
+        clients.supabase().table("chat_sessions").delete().eq("id", session_id).execute()
     except Exception as e:
         print(f"Error deleting session: {e}")
\ No newline at end of file
@@ -0,0 +1,228 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+import metrics
+import tracing
+
+# --- CONFIGURATION ---
+CACHE_DIR = os.environ.get("MIMI_CACHE_DIR", ".cache")
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+MEMORY_CACHE_SIZE = 2048   # vectors kept in process, as float32 arrays (3072 dims = 12 KB each, ~24 MB total)
+DISK_CACHE_ENTRIES = 20000 # query vectors kept on disk (~240 MB), the oldest are evicted first
+
+
+def normalize(text: str, casefold: bool = False):
+    """
+    Same meaning -> same key: unicode-normalised, whitespace collapsed.
+    Queries are also case-folded ("Summary" == "summary"); document chunks keep
+    their case because it is part of the content we embed.
+    """
+    text = " ".join(unicodedata.normalize("NFKC", text).split())
+    return text.casefold() if casefold else text
+
+
+class _LRU:
+    """
+    Small thread-safe LRU, first tier of the cache. Holds array("f") vectors:
+    a list of 3072 Python floats would be ~96 KB instead of 12 KB.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class _DiskStore:
+    """
+    Second tier: SQLite file of float32 blobs, survives restarts and is shared
+    by every worker on the machine. Holds at most max_entries rows: past that
+    the oldest written are deleted.
+    """
+
+    def __init__(self, path, max_entries=DISK_CACHE_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                              "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL DEFAULT 0)")
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(embeddings)")]
+            if "created_at" not in columns:
+                # Files from before the limit: their rows count as the oldest
+                self.conn.execute("ALTER TABLE embeddings ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created_idx ON embeddings (created_at)")
+            self.conn.commit()
+            self.count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        found = {}
+        with self.lock:
+            # SQLite limits the number of bound parameters, go in slices
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                for key, blob in self.conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part):
+                    found[key] = array("f", blob)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items]
+            )
+            # Counted in memory (replaced keys make it an overestimate), checked when over
+            self.count += len(items)
+            if self.count > self.max_entries:
+                self.count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                excess = self.count - self.max_entries
+                if excess > 0:
+                    self.conn.execute("DELETE FROM embeddings WHERE key IN "
+                                      "(SELECT key FROM embeddings ORDER BY created_at LIMIT ?)", (excess,))
+                    self.count -= excess
+                    metrics.incr("embedding_cache.disk_evictions", excess)
+            self.conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps a LangChain embeddings client with a two-tier cache:
+    in-process LRU -> SQLite on disk -> the real API.
+
+    Keys are (model, task, normalised text). Task matters because Gemini embeds
+    queries and documents differently. Only query vectors go to disk: a
+    document chunk is embedded once (re-ingestion skips stored chunks by
+    hash) and its vector is already in the documents table.
+    """
+
+    def __init__(self, inner, model: str, memory_size=MEMORY_CACHE_SIZE, path=EMBEDDING_CACHE_PATH):
+        self.inner = inner
+        self.model = model
+        self.memory = _LRU(memory_size)
+        try:
+            self.disk = _DiskStore(path) if path else None
+        except Exception as e:
+            # Read-only filesystem etc. - the memory tier still works
+            print(f"Embedding disk cache disabled: {e}")
+            self.disk = None
+
+    def _key(self, task, text):
+        raw = f"{self.model}\x00{task}\x00{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        """
+        Returns {key: array("f")} for everything found in either tier.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[key] = vector
+                metrics.incr("embedding_cache.memory_hits")
+            else:
+                missing.append(key)
+
+        if missing and self.disk is not None:
+            from_disk = self.disk.get_many(missing)
+            for key, vector in from_disk.items():
+                self.memory.put(key, vector)
+                found[key] = vector
+            metrics.incr("embedding_cache.disk_hits", len(from_disk))
+
+        metrics.incr("embedding_cache.misses", len(keys) - len(found))
+        return found
+
+    def _store(self, items, persist=True):
+        for key, vector in items:
+            self.memory.put(key, array("f", vector))
+        if persist and self.disk is not None:
+            try:
+                self.disk.put_many(items)
+            except Exception as e:
+                print(f"Could not persist embeddings: {e}")
+        metrics.set_gauge("embedding_cache.memory_size", len(self.memory))
+
+    def embed_query(self, text: str):
+        key = self._key("query", normalize(text, casefold=True))
+        found = self._lookup([key])
+        if key in found:
+            return found[key].tolist()
+        with tracing.span("gemini embed_query"):
+            vector = self.inner.embed_query(text)
+        self._store([(key, vector)])
+        return vector
+
+    def embed_documents(self, texts):
+        keys = [self._key("document", normalize(t)) for t in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+
+        # One API call for all the misses (deduplicated)
+        todo = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in todo:
+                todo[key] = text
+        if todo:
+            with tracing.span("gemini embed_documents", texts=len(todo)):
+                vectors = self.inner.embed_documents(list(todo.values()))
+            fresh = list(zip(todo.keys(), vectors))
+            self._store(fresh, persist=False)
+            found.update(fresh)
+
+        # Cached vectors are arrays, fresh ones the API's lists: callers get lists
+        return [_as_list(found[key]) for key in keys]
+
+
+def _as_list(vector):
+    return vector.tolist() if isinstance(vector, array) else vector
+
+
+def stats():
+    """
+    Hit/miss counters for the debug panel.
+    """
+    counters = metrics.snapshot()["counters"]
+    memory = counters.get("embedding_cache.memory_hits", 0)
+    disk = counters.get("embedding_cache.disk_hits", 0)
+    misses = counters.get("embedding_cache.misses", 0)
+    total = memory + disk + misses
+    return {
+        "memory_hits": memory,
+        "disk_hits": disk,
+        "misses": misses,
+        "hit_rate": (memory + disk) / total if total else None,
+    }
@@ -0,0 +1,95 @@
+import json
+import threading
+
+import metrics
+
+# googleapiclient & co. are imported on first use (they are slow to import and
+# most turns never touch Gmail or Calendar)
+
+# One set of credentials and one service object per API for the whole process.
+# httplib2 is not thread-safe, so every request gets its own Http (see _request_builder);
+# the expensive part (parsing the discovery document) happens once per API.
+_lock = threading.Lock()
+_credentials = None
+_token_json = None
+_services = {}
+
+
+def _get_credentials(token_json):
+    global _credentials, _token_json
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    with _lock:
+        if _credentials is None or token_json != _token_json:
+            # New/rotated token: start over
+            _credentials = Credentials.from_authorized_user_info(json.loads(token_json))
+            _token_json = token_json
+            _services.clear()
+        if not _credentials.valid and _credentials.refresh_token:
+            _credentials.refresh(Request())
+            metrics.incr("google.token_refreshes")
+        return _credentials
+
+
+def _request_builder(credentials):
+    import httplib2
+    import google_auth_httplib2
+    from googleapiclient.http import HttpRequest
+
+    def build_request(http, *args, **kwargs):
+        # Fresh transport per request so threads never share an httplib2.Http;
+        # AuthorizedHttp also refreshes the token if it expires mid-way.
+        new_http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+        return HttpRequest(new_http, *args, **kwargs)
+    return build_request
+
+
+def get_service(token_json: str, api: str, version: str):
+    """
+    Returns a cached, thread-safe googleapiclient service (e.g. "gmail", "v1").
+    token_json: the GOOGLE_TOKEN secret.
+    """
+    credentials = _get_credentials(token_json)
+    key = (api, version)
+    with _lock:
+        service = _services.get(key)
+        if service is not None:
+            metrics.incr("google.service_hits")
+            return service
+
+    import httplib2
+    import google_auth_httplib2
+    from googleapiclient.discovery import build
+
+    metrics.incr("google.service_builds")
+    with metrics.timer("google.build_seconds"):
+        service = build(
+            api, version,
+            http=google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http()),
+            requestBuilder=_request_builder(credentials),
+            # Use the discovery documents bundled with the library (no network)
+            static_discovery=True,
+        )
+    with _lock:
+        _services[key] = service
+    return service
+
+
+def batch_execute(service, requests, batch_size=50):
+    """
+    Runs several requests of one service as Google batch calls (one HTTP round
+    trip per batch_size requests). Returns the responses in order; a failed
+    request gives its exception instead of a response.
+    """
+    results = [None] * len(requests)
+
+    def collect(request_id, response, exception):
+        results[int(request_id)] = exception if exception is not None else response
+
+    for start in range(0, len(requests), batch_size):
+        batch = service.new_batch_http_request(callback=collect)
+        for i, request in enumerate(requests[start:start + batch_size], start=start):
+            batch.add(request, request_id=str(i))
+        batch.execute()
+    return results
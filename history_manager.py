@@ -0,0 +1,165 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import metrics
+import tracing
+
+# --- CONFIGURATION ---
+TOKEN_BUDGET = 6000        # max history tokens sent to the agent per turn
+KEEP_TURNS = 6             # most recent user turns always sent verbatim
+FOLD_BATCH = 4             # fold older messages into the summary this many at a time
+MAX_SESSIONS = 500         # summaries kept in memory (LRU)
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and Mimi, their assistant.
+Update the summary with the new messages. Keep names, dates, decisions, preferences, open tasks and anything
+the user asked Mimi to remember. Be concise (under 250 words). Reply with the summary only."""
+
+
+def estimate_tokens(messages):
+    """
+    Cheap token estimate (~4 characters per token plus per-message overhead).
+    Good enough for budgeting, no tokenizer download needed.
+    """
+    total = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        total += len(content) // 4 + 4
+    return total
+
+
+def _fingerprint(messages):
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(message.type.encode())
+        digest.update(str(message.content).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _transcript(messages):
+    lines = []
+    for message in messages:
+        role = "User" if isinstance(message, HumanMessage) else "Mimi"
+        lines.append(f"{role}: {message.content}")
+    return "\n".join(lines)
+
+
+def _slices(messages, budget):
+    part, size = [], 0
+    for message in messages:
+        tokens = estimate_tokens([message])
+        if part and size + tokens > budget:
+            yield part
+            part, size = [], 0
+        part.append(message)
+        size += tokens
+    if part:
+        yield part
+
+
+class HistoryManager:
+    """
+    Sits between st.session_state.messages and the agent.
+
+    The last KEEP_TURNS turns go through verbatim; everything older is folded
+    into a summary that is updated incrementally (only newly aged-out messages
+    are sent to the LLM) and cached per session_id.
+    """
+
+    def __init__(self, llm, budget=TOKEN_BUDGET, keep_turns=KEEP_TURNS):
+        self.llm = llm
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.lock = threading.Lock()
+        # session_id -> (number of messages folded, fingerprint of them, summary)
+        self.summaries = OrderedDict()
+
+    def _split(self, messages):
+        """
+        Index where the verbatim window starts: KEEP_TURNS user turns back,
+        shrunk further (down to the last turn) if that alone blows the budget.
+        """
+        starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        if not starts:
+            return 0
+        keep = min(self.keep_turns, len(starts))
+        while keep > 1 and estimate_tokens(messages[starts[-keep]:]) > self.budget * 0.75:
+            keep -= 1
+        return starts[-keep]
+
+    def _cached(self, session_id, older):
+        with self.lock:
+            entry = self.summaries.get(session_id)
+            if entry is None:
+                return 0, ""
+            self.summaries.move_to_end(session_id)
+        folded, fingerprint, summary = entry
+        # Only reuse it if the conversation still starts the same way
+        if folded <= len(older) and _fingerprint(older[:folded]) == fingerprint:
+            return folded, summary
+        return 0, ""
+
+    def _remember(self, session_id, older, folded, summary):
+        with self.lock:
+            self.summaries[session_id] = (folded, _fingerprint(older[:folded]), summary)
+            self.summaries.move_to_end(session_id)
+            while len(self.summaries) > MAX_SESSIONS:
+                self.summaries.popitem(last=False)
+
+    def _fold(self, summary, new_messages):
+        request = f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{_transcript(new_messages)}"
+        with metrics.timer("history.summarize_seconds"), tracing.span("history.summarize", messages=len(new_messages)):
+            response = self.llm.invoke([SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=request)])
+        metrics.incr("history.summaries")
+        return response.content
+
+    def prepare(self, session_id, messages):
+        """
+        Returns the messages to send to the agent for this turn.
+        """
+        total = estimate_tokens(messages)
+        if total <= self.budget:
+            return messages
+
+        split = self._split(messages)
+        older, recent = messages[:split], messages[split:]
+        folded, summary = self._cached(session_id, older)
+
+        pending = older[folded:]
+        over_budget = estimate_tokens(pending) + estimate_tokens(recent) > self.budget
+        if pending and (len(pending) >= FOLD_BATCH or over_budget):
+            try:
+                # A reopened long chat can have thousands of messages to fold:
+                # at most a budget's worth per summary call
+                for part in _slices(pending, self.budget):
+                    summary = self._fold(summary, part)
+                    folded += len(part)
+                    self._remember(session_id, older, folded, summary)
+                pending = []
+            except Exception as e:
+                # e.g. RateLimited: keep what was folded, try again next time
+                print(f"History summary failed: {e}")
+                pending = older[folded:]
+
+        context = []
+        if summary:
+            context.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+
+        # Unfolded messages only go out if they fit: the oldest are dropped first
+        room = self.budget - estimate_tokens(context) - estimate_tokens(recent)
+        size = estimate_tokens(pending)
+        start = 0
+        while start < len(pending) and size > room:
+            size -= estimate_tokens([pending[start]])
+            start += 1
+        if start:
+            metrics.incr("history.messages_dropped", start)
+        prepared = context + pending[start:] + recent
+
+        sent = estimate_tokens(prepared)
+        metrics.incr("history.tokens_saved", total - sent)
+        metrics.observe("history.prompt_tokens", sent)
+        print(f"History for {session_id[:8]}: {total} -> {sent} tokens ({total - sent} saved)")
+        return prepared
@@ -0,0 +1,302 @@
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import clients
+import ingestion
+import metrics
+import rag_manager
+import tracing
+
+# --- CONFIGURATION ---
+PARSE_WORKERS = os.cpu_count() or 2   # processes extracting/splitting PDFs
+FILE_WORKERS = 2                      # files embedded/stored at the same time
+PAGES_PER_TASK = 25                   # big PDFs are parsed in page ranges on several cores
+PARSE_AHEAD = PARSE_WORKERS * 2       # page ranges parsed (or parsing) but not yet stored
+KEEP_JOBS = 20                        # finished jobs kept for the status panel
+
+# Parsing and splitting are CPU-bound (pypdf, the text splitter), so they run in
+# other processes: the Streamlit threads keep the GIL for interactive chats.
+# "spawn" because forking a process that has threads running is unsafe.
+# Parsing is fed for every queued file, in order, by one thread (_feed): all
+# cores work however many files are waiting to be stored. PARSE_AHEAD bounds
+# the parsed chunks held in memory.
+_parse_pool = None
+_file_pool = ThreadPoolExecutor(max_workers=FILE_WORKERS, thread_name_prefix="ingest")
+_parse_queue = queue.Queue()
+_parse_slots = threading.Semaphore(PARSE_AHEAD)
+_feeder = None
+_lock = threading.Lock()
+_submit_lock = threading.Lock()
+_jobs = OrderedDict()
+
+
+def _get_parse_pool():
+    global _parse_pool
+    with _lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _parse_pool
+
+
+def _discard_parse_pool(pool):
+    # A worker died (e.g. out of memory on a huge PDF): the pool can't be used
+    # anymore, the next file gets a fresh one
+    global _parse_pool
+    with _lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class IngestJob:
+    """
+    A batch of files ingested in the background. files is a list of dicts
+    (name, state, pages, pages_done, chunks, added, unchanged, removed, error),
+    state being queued -> parsing -> storing -> done / failed.
+    """
+
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex[:8]
+        self.label = label
+        self.created = time.time()
+        self.files = []
+        self.lock = threading.Lock()
+        self.remaining = 0
+
+    def _add(self, name):
+        entry = {"name": name, "state": "queued", "pages": None, "pages_done": 0, "chunks": 0,
+                 "added": 0, "unchanged": 0, "removed": 0, "error": None}
+        self.files.append(entry)
+        self.remaining += 1
+        return entry
+
+    def _update(self, entry, **values):
+        with self.lock:
+            entry.update(values)
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(entry) for entry in self.files]
+
+    @property
+    def done(self):
+        with self.lock:
+            return self.remaining == 0
+
+
+def _finish_file(job):
+    with job.lock:
+        job.remaining -= 1
+        last = job.remaining == 0
+    if last:
+        # One local index sync for the whole job instead of one per file
+        rag_manager.refresh_after_ingest(
+            {"added": sum(f["added"] for f in job.files), "removed": sum(f["removed"] for f in job.files)}
+        )
+        metrics.incr("ingest.jobs_finished")
+
+
+class _Parse:
+    """
+    One file's parsing, fed by _feed and consumed by _ingest_file: tasks gets
+    (doc_hash, total_pages, stored version if it is the same file), then the
+    page-range futures in order (or an exception), then None.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tasks = queue.Queue()
+        self.pool = None
+        self.cancelled = False
+        self.finished = False   # None was read
+
+
+def _feed():
+    while True:
+        job, entry, parse = _parse_queue.get()
+        try:
+            job._update(entry, state="parsing")
+            with open(parse.path, "rb") as f:
+                doc_hash = ingestion.fingerprint(f.read())
+            total = ingestion.count_pages(parse.path)
+            job._update(entry, pages=total)
+            stored = ingestion.stored_version(clients.supabase(), entry["name"])
+            if stored and stored["doc_hash"] != doc_hash:
+                stored = None
+            parse.tasks.put((doc_hash, total, stored))
+            # Already ingested as is: nothing to parse or embed
+            for start in ([] if stored else range(0, total, PAGES_PER_TASK)):
+                _parse_slots.acquire()
+                if parse.cancelled:
+                    _parse_slots.release()
+                    break
+                parse.pool = _get_parse_pool()
+                try:
+                    parse.tasks.put(parse.pool.submit(ingestion.parse_pdf_pages, parse.path, start, start + PAGES_PER_TASK))
+                except BaseException:
+                    _parse_slots.release()
+                    raise
+        except Exception as e:
+            parse.tasks.put(e)
+        finally:
+            parse.tasks.put(None)
+
+
+def _ensure_feeder():
+    global _feeder
+    with _lock:
+        if _feeder is None:
+            _feeder = threading.Thread(target=_feed, name="ingest-parse", daemon=True)
+            _feeder.start()
+
+
+def _next_task(parse):
+    task = parse.tasks.get()
+    if task is None:
+        parse.finished = True
+    elif isinstance(task, Exception):
+        raise task
+    return task
+
+
+def _drain(parse):
+    # Stop the feeder for this file and give back the slots of what it parsed
+    parse.cancelled = True
+    while not parse.finished:
+        task = parse.tasks.get()
+        if task is None:
+            parse.finished = True
+        elif not isinstance(task, Exception):
+            task.cancel()
+            _parse_slots.release()
+
+
+def _ingest_file(job, entry, parse, cleanup):
+    try:
+        with tracing.span("ingest_file", source=entry["name"]):
+            first = _next_task(parse)
+            if first is None:
+                raise RuntimeError("parsing stopped")
+            doc_hash, total, stored = first
+            if stored:
+                job._update(entry, state="done", pages_done=total, unchanged=stored["chunks"])
+                metrics.incr("ingest.files_unchanged")
+                return
+
+            def chunks():
+                # In document order; embedding starts as soon as the first range is parsed
+                while (future := _next_task(parse)) is not None:
+                    try:
+                        yield from future.result()
+                    finally:
+                        _parse_slots.release()
+
+            def progress(chunks_done, pages_done, total_pages):
+                job._update(entry, state="storing", chunks=chunks_done, pages_done=pages_done)
+
+            try:
+                stats = rag_manager.ingest_chunks(chunks(), source=entry["name"], doc_hash=doc_hash,
+                                                  progress=progress, total_pages=total, sync_index=False)
+            finally:
+                _drain(parse)
+        job._update(entry, state="done", pages_done=total, **stats)
+        metrics.incr("ingest.files_done")
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool) and parse.pool is not None:
+            _discard_parse_pool(parse.pool)
+        print(f"Ingesting {entry['name']} failed: {e}")
+        job._update(entry, state="failed", error=str(e))
+        metrics.incr("ingest.files_failed")
+    finally:
+        if cleanup:
+            try:
+                os.remove(parse.path)
+            except OSError:
+                pass
+        _finish_file(job)
+
+
+def _register(job):
+    with _lock:
+        _jobs[job.id] = job
+        while len(_jobs) > KEEP_JOBS:
+            oldest = next(iter(_jobs.values()))
+            if not oldest.done:
+                break
+            _jobs.popitem(last=False)
+    return job
+
+
+def _start(job, items):
+    """
+    items: (entry, path, delete_path_when_done)
+    """
+    _register(job)
+    _ensure_feeder()
+    # Same order in both queues: a file being stored never waits behind parse
+    # work of files queued after it
+    with _submit_lock:
+        for entry, path, cleanup in items:
+            parse = _Parse(path)
+            _parse_queue.put((job, entry, parse))
+            _file_pool.submit(_ingest_file, job, entry, parse, cleanup)
+    return job
+
+
+def submit_uploads(uploaded_files):
+    """
+    Starts a background job for Streamlit UploadedFiles and returns it at once.
+    The bytes are written to temp files first, the job never touches Streamlit.
+    """
+    job = IngestJob(f"{len(uploaded_files)} uploaded file(s)")
+    items = []
+    for uploaded_file in uploaded_files:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+            tmp_file.write(uploaded_file.getvalue())
+        # Chunks are keyed on the real file name, not the temp path
+        items.append((job._add(uploaded_file.name), tmp_file.name, True))
+    return _start(job, items)
+
+
+def submit_directory(directory):
+    """
+    Admin backfill: every PDF under `directory` (recursively). Files are keyed
+    by their path relative to it, so re-running the backfill is incremental.
+    """
+    if not os.path.isdir(directory):
+        raise ValueError(f"Not a directory: {directory}")
+    job = IngestJob(f"Backfill of {directory}")
+    items = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith(".pdf"):
+                path = os.path.join(root, name)
+                items.append((job._add(os.path.relpath(path, directory)), path, False))
+    return _start(job, items)
+
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+if __name__ == "__main__":
+    # python ingest_jobs.py /path/to/pdfs   (reads .streamlit/secrets.toml)
+    import sys
+
+    job = submit_directory(sys.argv[1])
+    while not job.done:
+        time.sleep(2)
+        files = job.snapshot()
+        finished = sum(f["state"] in ("done", "failed") for f in files)
+        print(f"{finished}/{len(files)} files finished")
+    for f in job.snapshot():
+        print(f"{f['state']:<7} {f['name']}: +{f['added']} ={f['unchanged']} -{f['removed']} {f['error'] or ''}")
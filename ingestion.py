@@ -0,0 +1,300 @@
+import hashlib
+import random
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+import metrics
+import tracing
+
+# --- CONFIGURATION ---
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+EMBED_BATCH_SIZE = 32      # chunks per embedding call / per insert
+EMBED_WORKERS = 4          # embedding calls in flight at once
+MAX_RETRIES = 5
+TABLE_NAME = "documents"
+SOURCES_TABLE = "document_sources"   # file version per source (migrations/003_document_sources.sql)
+
+
+def count_pages(path):
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def parse_pdf_pages(path, first, last, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Extracts and splits pages [first, last) of a PDF.
+    CPU-bound and picklable in and out, so ingest_jobs.py runs it in a process
+    pool (a big file is cut into page ranges that run on different cores).
+    Returns [(page_number, chunk), ...] with 1-based page numbers.
+    """
+    from pypdf import PdfReader
+    from langchain_core.documents import Document
+
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    pages = (
+        Document(page_content=reader.pages[i].extract_text() or "", metadata={"page": i, "total_pages": total})
+        for i in range(first, min(last, total))
+    )
+    return [(first + page_number, chunk) for page_number, chunk in chunk_pages(pages, chunk_size, chunk_overlap)]
+
+
+def chunk_pages(pages, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Splits page by page, yielding (page_number, chunk) as we go.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for page_number, page in enumerate(pages, start=1):
+        for chunk in splitter.split_documents([page]):
+            yield page_number, chunk
+
+
+_RATE_LIMIT_TEXT = re.compile(r"\b429\b|rate.?limit|resource.?exhausted|quota exceeded", re.IGNORECASE)
+
+
+def _is_rate_limit(error):
+    # Status code or exception type where the client exposes one (as in
+    # llm_scheduler); Gemini errors that come wrapped only have the message
+    if 429 in (getattr(error, "status_code", None), getattr(error, "code", None)):
+        return True
+    if type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return True
+    return bool(_RATE_LIMIT_TEXT.search(str(error)))
+
+
+def embed_with_retry(embed_documents, texts, max_retries=MAX_RETRIES):
+    """
+    Embeds one batch. Rate-limit errors back off exponentially (with jitter),
+    anything else gets a couple of quick retries before giving up.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return embed_documents(texts)
+        except Exception as e:
+            transient = _is_rate_limit(e)
+            if attempt == max_retries or (not transient and attempt >= 1):
+                raise
+            metrics.incr("ingest.embed_retries")
+            tracing.incr_attribute("retries")
+            delay = (2 ** attempt if transient else 0.5) + random.uniform(0, 0.5)
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def fingerprint(data: bytes):
+    """
+    Hash of the whole file, recorded per source as doc_hash (see stored_version).
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_hash(text: str):
+    """
+    Hash of a chunk's text. Whitespace is normalised so re-extraction noise
+    (double spaces, line breaks) doesn't count as a change.
+    """
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def existing_chunks(supabase_client, source, page_size=1000):
+    """
+    {chunk_hash: (row id, metadata)} for everything already stored for this
+    source. Reads ids and metadata only (no content, no vectors), a page at a
+    time, keyset-paginated on id (OFFSET pages have no stable order: a skipped
+    row would be re-embedded and never cleaned up).
+    """
+    found = {}
+    last_id = None
+    while True:
+        query = supabase_client.table(TABLE_NAME)\
+            .select("id, metadata")\
+            .eq("metadata->>source", source)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(page_size).execute().data
+        for row in rows:
+            metadata = row.get("metadata") or {}
+            found[metadata.get("chunk_hash")] = (row["id"], metadata)
+        if len(rows) < page_size:
+            return found
+        last_id = rows[-1]["id"]
+
+
+def update_metadata(supabase_client, updates, workers=EMBED_WORKERS):
+    """
+    updates: [(row id, metadata)]. One request per row (PostgREST can't bulk
+    update different values), a few in flight.
+    """
+    def update(item):
+        row_id, metadata = item
+        supabase_client.table(TABLE_NAME).update({"metadata": metadata}).eq("id", row_id).execute()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(tracing.in_context(update), item) for item in updates]:
+            future.result()
+
+
+def stored_version(supabase_client, source):
+    """
+    {doc_hash, chunks} of the last complete ingestion of `source`, or None.
+    """
+    try:
+        rows = supabase_client.table(SOURCES_TABLE)\
+            .select("doc_hash, chunks")\
+            .eq("source", source)\
+            .limit(1)\
+            .execute().data
+        return rows[0] if rows else None
+    except Exception as e:
+        # e.g. the migration hasn't been run: every file is simply processed
+        print(f"Could not read the stored version of {source}: {e}")
+        return None
+
+
+def record_version(supabase_client, source, doc_hash, chunks):
+    try:
+        supabase_client.table(SOURCES_TABLE)\
+            .upsert({"source": source, "doc_hash": doc_hash, "chunks": chunks}, on_conflict="source")\
+            .execute()
+    except Exception as e:
+        print(f"Could not record the version of {source}: {e}")
+
+
+def delete_chunks(supabase_client, ids, batch_size=200):
+    ids = list(ids)
+    for i in range(0, len(ids), batch_size):
+        supabase_client.table(TABLE_NAME).delete().in_("id", ids[i:i + batch_size]).execute()
+
+
+def _batches(chunks, size):
+    batch = []
+    for item in chunks:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _metadata(chunk, chunk_index, digest, extra_metadata):
+    return {**chunk.metadata, **extra_metadata, "chunk_hash": digest, "chunk_index": chunk_index}
+
+
+def _comparable(metadata):
+    # chunk_index is the position when the chunk was stored: any insertion
+    # before it would shift every later chunk. doc_hash: older rows had it.
+    return {key: value for key, value in metadata.items() if key not in ("chunk_index", "doc_hash")}
+
+
+def _rows(source, batch, vectors, extra_metadata):
+    # Not at the top: the PDF parsing processes import this module and never need numpy
+    from vector_profile import to_pgvector
+    rows = []
+    for (_, chunk_index, digest, chunk), vector in zip(batch, vectors):
+        rows.append({
+            # Deterministic ids: re-running a half-committed batch just overwrites it
+            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}/{digest}")),
+            "content": chunk.page_content,
+            "metadata": _metadata(chunk, chunk_index, digest, extra_metadata),
+            "embedding": to_pgvector(vector),
+        })
+    return rows
+
+
+def run(pages, embed_documents, supabase_client, source, doc_hash, extra_metadata=None,
+        progress=None, total_pages=None, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS, chunks=None):
+    """
+    pages -> chunks -> concurrent embedding batches -> ordered bulk upserts.
+
+    Incremental: chunks whose hash is already stored for `source` are skipped
+    (no embedding call), new/changed ones are embedded and inserted, and stored
+    chunks that no longer appear in the document are deleted at the end.
+    Re-ingesting an unchanged file therefore costs zero embedding calls, and a
+    run that failed half way simply picks up where it stopped.
+
+    pages: iterable of LangChain Documents (one per page), consumed lazily.
+    chunks: instead of pages, already split (page_number, chunk) pairs in
+        document order (e.g. from parse_pdf_pages in a process pool).
+    source: name identifying the document (the uploaded file name).
+    doc_hash: fingerprint() of the file, recorded in SOURCES_TABLE once the
+        run completed (see stored_version).
+    progress: optional callback(chunks_done, pages_done, total_pages).
+    Returns {"added": n, "unchanged": n, "removed": n}.
+    """
+    metadata = {**(extra_metadata or {}), "source": source}
+    existing = existing_chunks(supabase_client, source)
+    seen = set()
+    relabel = []
+    stats = {"added": 0, "unchanged": 0, "removed": 0}
+    pages_done = 0
+    in_flight = deque()
+
+    def new_chunks():
+        nonlocal pages_done
+        chunk_index = 0
+        for page_number, chunk in chunks if chunks is not None else chunk_pages(pages):
+            pages_done = page_number
+            digest = chunk_hash(chunk.page_content)
+            if digest in seen:
+                # Same text twice in one document (headers, footers...): keep one
+                continue
+            seen.add(digest)
+            chunk_index += 1
+            if digest in existing:
+                stats["unchanged"] += 1
+                row_id, stored = existing[digest]
+                current = _metadata(chunk, chunk_index, digest, metadata)
+                if _comparable(stored) != _comparable(current):
+                    # Same text, but e.g. on another page in the new version
+                    relabel.append((row_id, current))
+                continue
+            yield page_number, chunk_index, digest, chunk
+
+    def report():
+        if progress:
+            progress(stats["added"] + stats["unchanged"], pages_done, total_pages)
+
+    def commit_oldest():
+        batch, future = in_flight.popleft()
+        vectors = future.result()
+        with metrics.timer("ingest.insert_seconds"), tracing.span("supabase upsert documents", rows=len(batch)):
+            supabase_client.table(TABLE_NAME)\
+                .upsert(_rows(source, batch, vectors, metadata))\
+                .execute()
+        stats["added"] += len(batch)
+        report()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in _batches(new_chunks(), batch_size):
+            texts = [chunk.page_content for *_, chunk in batch]
+            # in_context: the pool threads report their spans under the ingest trace
+            in_flight.append((batch, pool.submit(tracing.in_context(embed_with_retry), embed_documents, texts)))
+
+            # Keep a bounded window so memory stays flat on huge files
+            while len(in_flight) > workers:
+                commit_oldest()
+
+        while in_flight:
+            commit_oldest()
+
+    # Only once everything new is stored: relabel what moved, drop what the
+    # new version no longer has, then record the version as complete
+    if relabel:
+        with tracing.span("supabase update documents.metadata", rows=len(relabel)):
+            update_metadata(supabase_client, relabel, workers)
+        metrics.incr("ingest.chunks_relabelled", len(relabel))
+    gone = [row_id for digest, (row_id, _) in existing.items() if digest not in seen]
+    delete_chunks(supabase_client, gone)
+    stats["removed"] = len(gone)
+    record_version(supabase_client, source, doc_hash, stats["added"] + stats["unchanged"])
+
+    report()
+    metrics.incr("ingest.chunks_written", stats["added"])
+    metrics.incr("ingest.chunks_skipped", stats["unchanged"])
+    return stats
@@ -0,0 +1,265 @@
+import re
+import threading
+
+import numpy as np
+from langchain_core.messages import SystemMessage
+
+import metrics
+import semantic_cache
+import tracing
+from embedding_cache import normalize
+
+# --- CONFIGURATION ---
+SIMILARITY_THRESHOLD = 0.80   # cosine with the closest example to route without rules
+MIN_MARGIN = 0.05             # ... and that much closer than the next route's example
+
+# What the full agent does best (small talk, multi-step requests): a message
+# closest to these is never routed.
+ROOT = "Mimi_Root"
+
+# Requests answered without the root agent. "tool" runs the tool itself and
+# one model call phrases the answer (1 LLM call); "agent" hands the message
+# to that specialist, whose answer is final (2 LLM calls). The examples are
+# embedded next to each tool's own description. side_effects: sends or
+# books something, so a rule hit must also be the closest route by embedding.
+_DATABASE = re.compile(r"\bwhat('?s| is) in (your|the|my) (database|knowledge base|memory)\b")
+
+# What a message talks about. A rule only routes on its own when no other
+# domain is mentioned ("put the meeting notes in an email" is not a calendar
+# request); otherwise the embedding margin decides.
+DOMAINS = {
+    "calendar": r"\b(calendar|schedule|agenda|meetings?|events?|appointments?|reminders?)\b",
+    "email": r"\b(e-?mails?|mails?|inbox|repl(y|ied|ies)|forward(ed)?|send|sent)\b|\S+@\S+",
+    "documents": r"\b(documents?|files?|pdfs?|notes|database|knowledge base|memory)\b",
+    "research": r"\b(news|headlines|articles?|weather|forecast|scores?)\b",
+}
+
+ROUTES = {
+    "list_upcoming_events": {
+        "kind": "tool",
+        "domain": "calendar",
+        "rules": [r"\b(upcoming|next) (events?|meetings?|appointments?)\b",
+                  r"\bwhat('?s| is) on my (calendar|schedule|agenda)\b",
+                  r"\b(show|list|check) my (calendar|schedule|agenda)\b"],
+        "examples": ["List my upcoming events", "What's on my calendar?", "What meetings do I have coming up?"],
+    },
+    "read_emails": {
+        "kind": "tool",
+        "domain": "email",
+        "rules": [r"\b(unread|new|latest) (e-?mails?|mails?)\b",
+                  r"\b(check|read) my (e-?mails?|inbox|mail)\b"],
+        "examples": ["Do I have any unread emails?", "Check my inbox", "Read my latest emails"],
+    },
+    "consult_knowledge_base": {
+        "kind": "tool",
+        "domain": "documents",
+        "rules": [_DATABASE.pattern,
+                  r"\bmy (favou?rite|preferred) (destinations?|places?|foods?)\b",
+                  r"\bmy (preferences|documents|files|pdfs?)\b"],
+        "examples": ["What is in your database?", "What are my favourite destinations?",
+                     "What do my documents say about the project timeline?"],
+        # Same trigger rule as the root prompt: "what's in your database" -> summary
+        "args": lambda text: {"query": "summary" if _DATABASE.search(text.casefold()) else text},
+    },
+    "Calendar_Specialist": {
+        "kind": "agent",
+        "domain": "calendar",
+        "side_effects": True,
+        "rules": [r"\b(schedule|book|create|add|set up|put)\b.*\b(meeting|event|appointment|call|reminder)\b"],
+        "examples": ["Schedule a meeting with Anna tomorrow at 3pm", "Add a dentist appointment on Friday at 10"],
+    },
+    "Communication_Specialist": {
+        "kind": "agent",
+        "domain": "email",
+        "side_effects": True,
+        "rules": [r"\b(send|write|draft)\b.*\b(e-?mail|mail)\b", r"\b(e-?mail)\s+\S+@\S+"],
+        "examples": ["Send an email to bob@example.com saying I'll be late", "Write an email to my manager about Friday"],
+    },
+    "Research_Specialist": {
+        "kind": "agent",
+        "domain": "research",
+        "rules": [r"\b(news|headlines|weather|forecast)\b", r"\b(latest|last night'?s) (scores?|results?)\b"],
+        "examples": ["What's the latest news about AI?", "What's the weather in London today?",
+                     "Who won the football last night?"],
+    },
+    ROOT: {
+        "kind": None,
+        "rules": [],
+        "examples": ["Hi Mimi, how are you?", "Thanks!", "Tell me a joke",
+                     "Plan my week: check my calendar, my email and the news",
+                     "Rewrite your last answer more formally"],
+    },
+}
+
+# Several requests in one message: the root agent plans those
+_MULTI = re.compile(r"\b(and then|and also|as well as|also)\b|\?.+\?")
+# Refers back to the conversation: specialists and tool arguments only see this message
+_FOLLOW_UP = re.compile(r"\b(it|that|this|these|those|them|him|her|again|same|instead)\b")
+
+ANSWER_PROMPT = """
+    You are Mimi, the Chief of Staff.
+    Answer the user's last message using the result of {tool} below.
+    Be concise; don't mention tools.
+
+    RESULT:
+    {result}
+    """
+
+
+class IntentRouter:
+    """
+    Fast path in front of the root agent for simple single-intent requests.
+
+    route() tries the rules first, then the closest route by embedding
+    similarity (examples + tool descriptions). A rule hit that mentions
+    another domain, or targets a side-effecting specialist, must also win
+    the embedding check. Anything multi-intent,
+    ambiguous, context-dependent or below SIMILARITY_THRESHOLD returns None:
+    the caller runs the full agent as before.
+    """
+
+    def __init__(self, tools, llm, embed_query, embed_documents, context=None,
+                 threshold=SIMILARITY_THRESHOLD, min_margin=MIN_MARGIN):
+        self.tools = {tool.name: tool for tool in tools}
+        self.routes = {name: spec for name, spec in ROUTES.items() if name == ROOT or name in self.tools}
+        self.rules = {name: [re.compile(rule) for rule in spec["rules"]] for name, spec in self.routes.items()}
+        self.domains = {name: re.compile(pattern) for name, pattern in DOMAINS.items()}
+        self.llm = llm
+        self.embed_query = embed_query
+        self.embed_documents = embed_documents
+        self.context = context
+        self.threshold = threshold
+        self.min_margin = min_margin
+        self.lock = threading.Lock()
+        self.labels = None
+        self.matrix = None
+
+    def _examples(self):
+        """
+        Unit vectors of every example (and tool description), embedded on first use.
+        """
+        with self.lock:
+            if self.matrix is None:
+                labels, texts = [], []
+                for name, spec in self.routes.items():
+                    samples = spec["examples"] + ([self.tools[name].description] if name in self.tools else [])
+                    labels += [name] * len(samples)
+                    texts += [normalize(text, casefold=True) for text in samples]
+                matrix = np.asarray(self.embed_documents(texts), dtype=np.float32)
+                self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+                self.labels = labels
+            return self.labels, self.matrix
+
+    def _classify(self, text):
+        """
+        (route, confidence, method) or (None, confidence, reason).
+        """
+        if _MULTI.search(text):
+            return None, 0.0, "multi_intent"
+        matched = {name for name, rules in self.rules.items() if any(rule.search(text) for rule in rules)}
+        if len(matched) > 1:
+            return None, 1.0, "multi_intent"
+        hit = matched.pop() if matched else None
+        if hit:
+            spec = self.routes[hit]
+            mentioned = {name for name, pattern in self.domains.items() if pattern.search(text)}
+            if not mentioned - {spec["domain"]} and not spec.get("side_effects"):
+                return hit, 1.0, "rule"
+
+        name, confidence, method = self._closest(text)
+        if hit and name == hit:
+            method = "rule+embedding"
+        return name, confidence, method
+
+    def _closest(self, text):
+        """
+        Closest route by embedding similarity, if above the threshold and the margin.
+        """
+        labels, matrix = self._examples()
+        query = np.asarray(self.embed_query(text), dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        best = {}
+        for label, score in zip(labels, scores.tolist()):
+            best[label] = max(best.get(label, -1.0), score)
+        ranked = sorted(best.items(), key=lambda item: -item[1])
+        name, confidence = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if name == ROOT:
+            return None, confidence, "general"
+        if confidence < self.threshold:
+            return None, confidence, "low_confidence"
+        if confidence - runner_up < self.min_margin:
+            return None, confidence, "ambiguous"
+        return name, confidence, "embedding"
+
+    def route(self, message, follow_up=False):
+        """
+        A decision {target, kind, args, confidence, method} for run(), or None
+        to use the full agent. follow_up: there are earlier turns the message
+        may refer to.
+        """
+        text = normalize(message, casefold=True)
+        with tracing.span("router.classify") as span:
+            try:
+                target, confidence, method = self._classify(text)
+            except Exception as e:
+                # e.g. the embedding API is down: the full agent still works
+                print(f"Intent router failed: {e}")
+                target, confidence, method = None, 0.0, "error"
+            spec = self.routes.get(target)
+            # Zero-argument tools don't care, the answer step sees the history anyway
+            if spec and follow_up and (spec["kind"] == "agent" or "args" in spec) and _FOLLOW_UP.search(text):
+                target, method = None, "needs_context"
+            span.set("route", target or ROOT)
+            span.set("method", method)
+            span.set("confidence", round(confidence, 3))
+
+        metrics.observe("router.confidence", confidence)
+        if target is None:
+            metrics.incr("router.fallback")
+            metrics.incr(f"router.fallback.{method}")
+            print(f"Router: full agent ({method}, {confidence:.2f})")
+            return None
+        metrics.incr("router.routed")
+        metrics.incr(f"router.routed.{target}")
+        print(f"Router: {target} ({method}, {confidence:.2f})")
+        args = spec["args"](message) if "args" in spec else {}
+        return {"target": target, "kind": spec["kind"], "args": args, "confidence": confidence, "method": method}
+
+    def run(self, decision, history):
+        """
+        Yields the answer's text. history: the turn's prepared messages, the
+        last one being the user's message.
+        """
+        target = decision["target"]
+        tool = self.tools[target]
+        semantic_cache.note(target)
+        if decision["kind"] == "agent":
+            # The specialist's own answer is the reply (its span, cache and priority apply)
+            yield tool.invoke(history[-1].content)
+            return
+
+        with tracing.span(f"tool {target}", routed=True):
+            result = tool.invoke(decision["args"])
+        prompt = ANSWER_PROMPT.format(tool=target, result=result)
+        if self.context is not None:
+            prompt = f"{self.context()}\n\n{prompt}"
+        for chunk in self.llm.stream([SystemMessage(content=prompt)] + list(history)):
+            if chunk.content:
+                yield chunk.content
+
+
+def stats():
+    """
+    Routed vs full-agent turns and why, for the debug panel.
+    """
+    counters = metrics.snapshot()["counters"]
+    routed = counters.get("router.routed", 0)
+    fallback = counters.get("router.fallback", 0)
+    return {
+        "routed": routed,
+        "fallback": fallback,
+        "routed_share": routed / (routed + fallback) if routed + fallback else None,
+        "targets": {k.split(".", 2)[2]: v for k, v in counters.items() if k.startswith("router.routed.")},
+        "reasons": {k.split(".", 2)[2]: v for k, v in counters.items() if k.startswith("router.fallback.")},
+    }
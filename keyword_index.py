@@ -0,0 +1,149 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+import metrics
+
+# Words, plus codes/dates kept whole ("prj-2024", "v1.2", "12/03/2024")
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str):
+    """
+    Lower-cased tokens. Compound tokens are also split into their parts so that
+    "PRJ-2024" matches both "prj-2024" and "2024".
+    """
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+class KeywordIndex:
+    """
+    Incrementally maintained inverted index with BM25 scoring over chunk texts.
+    add() / remove() touch only the postings of that chunk's terms.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.postings = defaultdict(dict)   # term -> {doc_id: term frequency}
+        self.doc_terms = {}                 # doc_id -> Counter (needed for remove)
+        self.doc_length = {}
+        self.total_length = 0
+        self.version = None                 # version of the source we were synced from
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, doc_id, text):
+        terms = Counter(tokenize(text))
+        with self.lock:
+            if doc_id in self.doc_terms:
+                self._remove(doc_id)
+            self.doc_terms[doc_id] = terms
+            self.doc_length[doc_id] = sum(terms.values())
+            self.total_length += self.doc_length[doc_id]
+            for term, tf in terms.items():
+                self.postings[term][doc_id] = tf
+
+    def remove(self, doc_id):
+        with self.lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_length.pop(doc_id)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def sync(self, docs, version=None):
+        """
+        Makes the index contain exactly `docs` ({doc_id: text}), only adding
+        and removing the difference.
+        """
+        current = set(self.doc_terms)
+        for doc_id in current - docs.keys():
+            self.remove(doc_id)
+        for doc_id in docs.keys() - current:
+            self.add(doc_id, docs[doc_id])
+        self.version = version
+
+    def search(self, query, k=20, allowed=None):
+        """
+        Top-k [(doc_id, bm25_score), ...]. allowed: optional set of doc ids.
+        """
+        with self.lock:
+            n = len(self.doc_terms)
+            if not n:
+                return []
+            average = self.total_length / n
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.doc_length[doc_id] / average)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+        metrics.incr("keyword_index.searches")
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses several ranked lists of ids: score = sum(1 / (k + rank)).
+    Returns [(id, fused_score), ...] best first.
+    """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def _overlap(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def mmr(candidates, k, lambda_mult=0.7, duplicate_threshold=0.9):
+    """
+    Maximal-marginal-relevance selection over [(row, score), ...] (best first).
+    Similarity between chunks is the Jaccard overlap of their tokens; near
+    duplicates (overlap >= duplicate_threshold) are dropped outright.
+    """
+    if not candidates:
+        return []
+    top = candidates[0][1] or 1.0
+    pool = [(row, score / top, set(tokenize(row["content"]))) for row, score in candidates]
+    selected = []
+    while pool and len(selected) < k:
+        best, best_value = None, None
+        for i, (row, relevance, tokens) in enumerate(pool):
+            redundancy = max((_overlap(tokens, chosen[2]) for chosen in selected), default=0.0)
+            if redundancy >= duplicate_threshold:
+                continue
+            value = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+            if best_value is None or value > best_value:
+                best, best_value = i, value
+        if best is None:
+            break
+        selected.append(pool.pop(best))
+    return [row for row, _, _ in selected]
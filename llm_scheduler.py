@@ -0,0 +1,372 @@
+import asyncio
+import contextvars
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+import metrics
+import tracing
+from history_manager import estimate_tokens
+
+# --- CONFIGURATION ---
+# Groq quotas of the model we use (override with the GROQ_RPM / GROQ_TPM secrets)
+DEFAULT_RPM = 30
+DEFAULT_TPM = 6000
+EXPECTED_COMPLETION_TOKENS = 512   # reserved per call until the real usage is known
+MAX_QUEUE = 100            # waiting calls before new ones are refused
+MAX_WAIT = 90.0            # seconds a call may wait for its turn
+MAX_RETRIES = 4            # after a 429
+BACKOFF_BASE = 2.0         # seconds, doubled per retry (plus jitter)
+POLL_INTERVAL = 0.05       # how often async waiters re-check their turn
+
+# Priorities: lower goes first
+ROOT = 0
+SUBAGENT = 1
+
+_session = contextvars.ContextVar("llm_session", default="default")
+_priority = contextvars.ContextVar("llm_priority", default=ROOT)
+
+
+class RateLimited(RuntimeError):
+    """
+    The model is over its quota (or the queue is full) and we gave up waiting.
+    The message is meant to be shown to the user as is.
+    """
+
+
+@contextmanager
+def caller(session=None, priority=None):
+    """
+    Tags every model call made inside the block (including from specialists
+    and tool threads that inherit our context) with a session and a priority.
+    """
+    tokens = []
+    if session is not None:
+        tokens.append((_session, _session.set(session)))
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class TokenBucket:
+    """
+    Refills at per_minute / 60 per second up to `capacity`. May go negative
+    when a call turns out to use more than was reserved.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        # A call bigger than the whole bucket only waits for a full bucket
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class _Ticket:
+    def __init__(self, seq, session, priority, tokens):
+        self.seq = seq
+        self.session = session
+        self.priority = priority
+        self.tokens = tokens
+        self.queued = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    Process-wide admission control for model calls.
+
+    A call waits until it is its turn and both buckets (requests and tokens
+    per minute) have room. Turn order: root-agent calls before sub-agent
+    calls, then the session that was served least recently (so one user's
+    fan-out can't starve everybody else), then arrival order.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, max_queue=MAX_QUEUE, max_wait=MAX_WAIT):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.waiting = []
+        self.served = {}           # session -> when it last got a slot
+        self.paused_until = 0.0    # set after a 429 (everybody backs off)
+        self.seq = itertools.count()
+
+    # --- queue ---
+    def _enqueue(self, tokens):
+        with self.cond:
+            if len(self.waiting) >= self.max_queue:
+                metrics.incr("llm.rejected")
+                raise RateLimited("Mimi is handling too many requests right now. Please try again in a minute.")
+            ticket = _Ticket(next(self.seq), _session.get(), _priority.get(), tokens)
+            self.waiting.append(ticket)
+            metrics.set_gauge("llm.queue_depth", len(self.waiting))
+            return ticket
+
+    def _drop(self, ticket):
+        with self.cond:
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+                metrics.set_gauge("llm.queue_depth", len(self.waiting))
+                self.cond.notify_all()
+
+    def _try_grant(self, ticket):
+        """
+        0 if the ticket got its slot, else seconds worth waiting. Lock held.
+        """
+        head = min(self.waiting, key=lambda t: (t.priority, self.served.get(t.session, 0.0), t.seq))
+        if head is not ticket:
+            return POLL_INTERVAL
+        now = time.monotonic()
+        wait = max(self.paused_until - now,
+                   self.requests.wait_time(1, now),
+                   self.tokens.wait_time(ticket.tokens, now))
+        if wait > 0:
+            return wait
+
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+        self.waiting.remove(ticket)
+        self.served[ticket.session] = now
+        if len(self.served) > 1000:
+            # Forget the sessions that have been quiet the longest
+            for session, _ in sorted(self.served.items(), key=lambda s: s[1])[:500]:
+                del self.served[session]
+        waited = now - ticket.queued
+        metrics.observe("llm.wait_seconds", waited)
+        metrics.observe(f"llm.wait_seconds.{'root' if ticket.priority == ROOT else 'subagent'}", waited)
+        metrics.set_gauge("llm.queue_depth", len(self.waiting))
+        self.cond.notify_all()
+        return 0.0
+
+    def _timed_out(self, ticket):
+        if time.monotonic() - ticket.queued < self.max_wait:
+            return False
+        self._drop(ticket)
+        metrics.incr("llm.timeouts")
+        return True
+
+    def acquire(self, tokens):
+        ticket = self._enqueue(tokens)
+        try:
+            with self.cond:
+                while True:
+                    wait = self._try_grant(ticket)
+                    if wait == 0:
+                        return ticket
+                    if self._timed_out(ticket):
+                        raise RateLimited(f"The language model is at its rate limit; waited {self.max_wait:.0f}s for a slot.")
+                    self.cond.wait(min(wait, self.max_wait))
+        except BaseException:
+            self._drop(ticket)
+            raise
+
+    async def aacquire(self, tokens):
+        ticket = self._enqueue(tokens)
+        try:
+            while True:
+                with self.cond:
+                    wait = self._try_grant(ticket)
+                if wait == 0:
+                    return ticket
+                if self._timed_out(ticket):
+                    raise RateLimited(f"The language model is at its rate limit; waited {self.max_wait:.0f}s for a slot.")
+                await asyncio.sleep(min(wait, POLL_INTERVAL * 4))
+        except BaseException:
+            # e.g. the tool timed out (cancelled) while we were queued
+            self._drop(ticket)
+            raise
+
+    def release(self, ticket, used_tokens):
+        """
+        Settles the token bucket with what the call really used.
+        """
+        if used_tokens:
+            with self.cond:
+                self.tokens.take(used_tokens - ticket.tokens)
+
+    def pause(self, seconds):
+        """
+        Server said 429: hold every call back, not just the one that failed.
+        """
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                rpm=int(st.secrets.get("GROQ_RPM", DEFAULT_RPM)),
+                tpm=int(st.secrets.get("GROQ_TPM", DEFAULT_TPM)),
+            )
+        return _scheduler
+
+
+# --- retries ---
+
+def _is_rate_limit(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_delay(error, attempt):
+    """
+    Retry-After from the response if there is one, else exponential back-off;
+    plus jitter so that callers who were limited together don't retry together.
+    """
+    delay = BACKOFF_BASE * 2 ** attempt
+    response = getattr(error, "response", None)
+    try:
+        delay = float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return delay + random.uniform(0, delay / 2)
+
+
+def _give_up(error):
+    metrics.incr("llm.rate_limit_failures")
+    return RateLimited(f"The language model is over its rate limit (still failing after {MAX_RETRIES} retries). "
+                       f"Please try again in a minute.")
+
+
+def _usage(result):
+    message = result.generations[0].message if result.generations else None
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens") or 0
+
+
+class SchedulingMixin:
+    """
+    Puts every call of a LangChain chat model through the process-wide
+    scheduler and retries 429s. Combine with a model class via scheduled().
+    """
+
+    def _estimate(self, messages):
+        completion = min(getattr(self, "max_tokens", None) or EXPECTED_COMPLETION_TOKENS, EXPECTED_COMPLETION_TOKENS)
+        return estimate_tokens(messages) + completion
+
+    def _on_rate_limit(self, error, attempt):
+        metrics.incr("llm.rate_limited")
+        if attempt == MAX_RETRIES:
+            raise _give_up(error) from error
+        delay = _retry_delay(error, attempt)
+        # On the active span (the agent or specialist turn): a slow turn shows why
+        tracing.incr_attribute("retries")
+        print(f"Groq rate limit hit, retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})")
+        get_scheduler().pause(delay)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        scheduler = get_scheduler()
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = scheduler.acquire(self._estimate(messages))
+            try:
+                result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                if not _is_rate_limit(e):
+                    raise
+                self._on_rate_limit(e, attempt)
+                continue
+            scheduler.release(ticket, _usage(result))
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        scheduler = get_scheduler()
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = await scheduler.aacquire(self._estimate(messages))
+            try:
+                result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                if not _is_rate_limit(e):
+                    raise
+                self._on_rate_limit(e, attempt)
+                continue
+            scheduler.release(ticket, _usage(result))
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        scheduler = get_scheduler()
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = scheduler.acquire(self._estimate(messages))
+            started, used = False, 0
+            try:
+                for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    used += (getattr(chunk.message, "usage_metadata", None) or {}).get("total_tokens") or 0
+                    yield chunk
+            except Exception as e:
+                # Once tokens went out we can't replay the call
+                if started or not _is_rate_limit(e):
+                    raise
+                self._on_rate_limit(e, attempt)
+                continue
+            scheduler.release(ticket, used)
+            return
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        scheduler = get_scheduler()
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = await scheduler.aacquire(self._estimate(messages))
+            started, used = False, 0
+            try:
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    used += (getattr(chunk.message, "usage_metadata", None) or {}).get("total_tokens") or 0
+                    yield chunk
+            except Exception as e:
+                if started or not _is_rate_limit(e):
+                    raise
+                self._on_rate_limit(e, attempt)
+                continue
+            scheduler.release(ticket, used)
+            return
+
+
+_scheduled_classes = {}
+
+
+def scheduled(model_cls):
+    """
+    Subclass of a chat model class (e.g. ChatGroq) whose calls are scheduled:
+        llm = scheduled(ChatGroq)(model=..., max_retries=0)
+    """
+    if model_cls not in _scheduled_classes:
+        _scheduled_classes[model_cls] = type(f"Scheduled{model_cls.__name__}", (SchedulingMixin, model_cls), {})
+    return _scheduled_classes[model_cls]
+
+
+def stats():
+    """
+    Queue depth, wait times and 429s, for the debug panel.
+    """
+    snapshot = metrics.snapshot()
+    return {
+        "queue_depth": snapshot["gauges"].get("llm.queue_depth", 0),
+        "wait": metrics.summary("llm.wait_seconds"),
+        "rate_limited": snapshot["counters"].get("llm.rate_limited", 0),
+        "rejected": snapshot["counters"].get("llm.rejected", 0) + snapshot["counters"].get("llm.timeouts", 0),
+    }
@@ -0,0 +1,336 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import metrics
+import vector_profile
+
+# --- CONFIGURATION ---
+CACHE_DIR = os.environ.get("MIMI_CACHE_DIR", ".cache")
+LOCAL_INDEX_DIR = os.path.join(CACHE_DIR, "local_index")
+IVF_MIN_ROWS = 20000   # below this brute force is faster than probing clusters
+IVF_PROBES = 8         # clusters scanned per query in IVF mode
+RESCORE_FACTOR = 10    # quantized storage: shortlist k * this rows, re-scored in float32
+RESCORE_MIN = 50
+TABLE_NAME = "documents"
+
+
+def remote_ids(supabase_client, page_size=1000):
+    """
+    Every id in the documents table. Keyset-paginated on id: OFFSET pages have
+    no stable order, a skipped id would look deleted.
+    """
+    ids, last_id = set(), None
+    while True:
+        query = supabase_client.table(TABLE_NAME).select("id")
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(page_size).execute().data
+        ids.update(str(row["id"]) for row in rows)
+        if len(rows) < page_size:
+            return ids
+        last_id = rows[-1]["id"]
+
+
+def _matches(metadata, filters):
+    return all(metadata.get(key) == value for key, value in filters.items())
+
+
+class LocalIndex:
+    """
+    In-process copy of the `documents` table for retrieval without a round trip.
+
+    Vectors live in a memory-mapped float32 matrix (unit-normalised, so a dot
+    product is the cosine similarity); ids, content and metadata in a JSON file
+    next to it. Search is a vectorised brute-force top-k, or an IVF (k-means
+    clusters) probe once the corpus is larger than IVF_MIN_ROWS.
+
+    dimensions: keep only this many (see vector_profile.truncate); an index
+    stored at another size is dropped and rebuilt by the next sync.
+    storage: "int8" / "binary" scan compact in-memory codes for a shortlist
+    and re-score it from the float32 matrix, which then stays on disk except
+    for the shortlisted rows.
+    """
+
+    def __init__(self, directory=LOCAL_INDEX_DIR, use_ivf=None, dimensions=None, storage="float32"):
+        if storage not in vector_profile.STORAGES:
+            raise ValueError(f"Unknown vector storage {storage!r}, expected one of {vector_profile.STORAGES}")
+        self.directory = directory
+        self.use_ivf = use_ivf
+        self.dimensions = dimensions
+        self.storage = storage
+        self.codes = self.scales = None
+        self.lock = threading.Lock()
+        self.ids, self.contents, self.metadata = [], [], []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.centroids = None
+        self.assignments = None
+        self.last_sync = 0.0
+        self.version = 0       # bumped on every change, lets others re-sync cheaply
+        self._positions = {}
+        self._load()
+
+    # --- STORAGE ---
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path("rows.json")) as f:
+                rows = json.load(f)
+        except FileNotFoundError:
+            return
+        if self.dimensions and rows["dim"] and rows["dim"] != self.dimensions:
+            print(f"Local index has {rows['dim']} dimensions, profile wants {self.dimensions}: rebuilding")
+            return
+        self.ids, self.contents, self.metadata = rows["ids"], rows["contents"], rows["metadata"]
+        self._positions = {row_id: i for i, row_id in enumerate(self.ids)}
+        if self.ids:
+            self.vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r",
+                                     shape=(len(self.ids), rows["dim"]))
+        if os.path.exists(self._path("ivf.npz")):
+            ivf = np.load(self._path("ivf.npz"))
+            self.centroids, self.assignments = ivf["centroids"], ivf["assignments"]
+        self._quantize()
+
+    def _quantize(self, block=8192):
+        """
+        Compact codes for the first search pass, built block by block from the
+        memory-mapped matrix.
+        """
+        self.codes = self.scales = None
+        if self.storage == "float32" or not self.ids:
+            return
+        codes, scales = [], []
+        for start in range(0, len(self.ids), block):
+            part = np.asarray(self.vectors[start:start + block])
+            if self.storage == "int8":
+                part_codes, part_scales = vector_profile.quantize_int8(part)
+                scales.append(part_scales)
+            else:
+                part_codes = vector_profile.quantize_binary(part)
+            codes.append(part_codes)
+        self.codes = np.concatenate(codes)
+        self.scales = np.concatenate(scales) if scales else None
+        metrics.set_gauge("local_index.code_bytes", self.codes.nbytes)
+
+    def _save(self, ids, contents, metadata, vectors):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path("vectors.f32.tmp")
+        if len(ids):
+            out = np.memmap(tmp, dtype=np.float32, mode="w+", shape=vectors.shape)
+            out[:] = vectors
+            out.flush()
+            del out
+            os.replace(tmp, self._path("vectors.f32"))
+        with open(self._path("rows.json.tmp"), "w") as f:
+            json.dump({"dim": int(vectors.shape[1]) if len(ids) else 0,
+                       "ids": ids, "contents": contents, "metadata": metadata}, f)
+        os.replace(self._path("rows.json.tmp"), self._path("rows.json"))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, row_id):
+        """
+        {id, content, metadata} of one row, or None.
+        """
+        i = self._positions.get(row_id)
+        if i is None:
+            return None
+        return {"id": row_id, "content": self.contents[i], "metadata": self.metadata[i]}
+
+    def texts(self):
+        return dict(zip(self.ids, self.contents))
+
+    # --- UPDATES ---
+    def apply(self, added_rows, removed_ids):
+        """
+        Adds rows ({id, content, metadata, embedding}) and drops ids, then
+        rewrites the memory-mapped matrix and reloads it.
+        """
+        removed = set(removed_ids)
+        with self.lock:
+            keep = [i for i, row_id in enumerate(self.ids) if row_id not in removed]
+            ids = [self.ids[i] for i in keep]
+            contents = [self.contents[i] for i in keep]
+            metadata = [self.metadata[i] for i in keep]
+            parts = [np.asarray(self.vectors[keep])] if keep else []
+
+            if added_rows:
+                ids += [row["id"] for row in added_rows]
+                contents += [row["content"] for row in added_rows]
+                metadata += [row.get("metadata") or {} for row in added_rows]
+                added = np.stack([vector_profile.from_pgvector(row["embedding"]) for row in added_rows])
+                parts.append(vector_profile.truncate(added, self.dimensions))
+
+            vectors = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+            self._save(ids, contents, metadata, vectors)
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+            self._load()
+            self._build_ivf()
+            self.version += 1
+
+    def sync(self, supabase_client, page_size=500):
+        """
+        Brings the index up to date with the `documents` table.
+        Only ids are listed; vectors are downloaded for new rows only.
+        """
+        with metrics.timer("local_index.sync_seconds"):
+            remote = remote_ids(supabase_client, page_size)
+            local = set(str(i) for i in self.ids)
+            new_ids = list(remote - local)
+            added = []
+            for i in range(0, len(new_ids), 100):
+                added += supabase_client.table(TABLE_NAME)\
+                    .select("id, content, metadata, embedding")\
+                    .in_("id", new_ids[i:i + 100]).execute().data
+            for row in added:
+                row["id"] = str(row["id"])
+
+            removed = local - remote
+            if added or removed:
+                self.apply(added, removed)
+            self.last_sync = time.time()
+            metrics.set_gauge("local_index.rows", len(self.ids))
+        return len(added), len(removed)
+
+    # --- IVF ---
+    def _ivf_enabled(self):
+        if self.use_ivf is not None:
+            return self.use_ivf and len(self.ids) > 0
+        return len(self.ids) >= IVF_MIN_ROWS
+
+    def _build_ivf(self, iterations=10, seed=0):
+        """
+        Plain k-means (sqrt(n) clusters) over the normalised vectors.
+        """
+        if not self._ivf_enabled():
+            self.centroids = self.assignments = None
+            return
+        data = np.asarray(self.vectors)
+        n_clusters = max(1, int(np.sqrt(len(data))))
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), n_clusters, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            for c in range(n_clusters):
+                members = data[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = vector_profile.normalize(centroids)
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = np.argmax(data @ self.centroids.T, axis=1).astype(np.int32)
+        np.savez(self._path("ivf.npz"), centroids=self.centroids, assignments=self.assignments)
+
+    # --- SEARCH ---
+    def _shortlist(self, query, candidates, size):
+        """
+        Rows (sorted, so the float32 re-read walks the file in order) with the
+        best approximate scores from the quantized codes.
+        """
+        rows = np.arange(len(self.ids)) if candidates is None else candidates
+        if len(rows) <= size:
+            return rows
+        codes = self.codes if candidates is None else self.codes[rows]
+        if self.storage == "int8":
+            scales = self.scales if candidates is None else self.scales[rows]
+            approx = vector_profile.int8_scores(codes, scales, query)
+        else:
+            approx = vector_profile.hamming_scores(codes, query)
+        return np.sort(rows[np.argpartition(-approx, size - 1)[:size]])
+
+    def search(self, query_vector, k=5, filters=None, threshold=None):
+        """
+        Top-k rows by cosine similarity, same shape as the match_documents RPC:
+        [{id, content, metadata, similarity}, ...]
+        filters: optional {metadata_key: value} that rows must match exactly.
+        """
+        with self.lock:
+            if not self.ids:
+                return []
+            # Same profile as the stored vectors, whatever size the caller embedded at
+            query = vector_profile.truncate(query_vector, self.vectors.shape[1])
+
+            candidates = None
+            if self.centroids is not None and self._ivf_enabled():
+                probes = np.argsort(-(self.centroids @ query))[:IVF_PROBES]
+                candidates = np.flatnonzero(np.isin(self.assignments, probes))
+            if filters:
+                allowed = [i for i, meta in enumerate(self.metadata) if _matches(meta, filters)]
+                candidates = np.asarray(allowed if candidates is None
+                                        else np.intersect1d(candidates, allowed), dtype=np.int64)
+            if candidates is not None and len(candidates) == 0:
+                return []
+
+            if self.codes is not None:
+                candidates = self._shortlist(query, candidates, max(k * RESCORE_FACTOR, RESCORE_MIN))
+
+            matrix = self.vectors if candidates is None else self.vectors[candidates]
+            scores = np.asarray(matrix @ query)
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            results = []
+            for position in top:
+                row = int(position if candidates is None else candidates[position])
+                score = float(scores[position])
+                if threshold is not None and score < threshold:
+                    continue
+                results.append({
+                    "id": self.ids[row],
+                    "content": self.contents[row],
+                    "metadata": self.metadata[row],
+                    "similarity": score,
+                })
+            metrics.incr("local_index.searches")
+            return results
+
+
+class DocumentTexts:
+    """
+    id -> {id, content, metadata} of every chunk, without the vectors: what the
+    keyword side of hybrid search needs when vector search runs in Supabase
+    (a LocalIndex would download every embedding for nothing).
+    Synced like LocalIndex: ids are listed, new rows only are fetched.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.lock = threading.Lock()
+        self.last_sync = 0.0
+        self.version = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, row_id):
+        return self.rows.get(row_id)
+
+    def texts(self):
+        with self.lock:
+            return {row_id: row["content"] for row_id, row in self.rows.items()}
+
+    def sync(self, supabase_client, batch_size=200):
+        with metrics.timer("document_texts.sync_seconds"):
+            remote = remote_ids(supabase_client)
+            new_ids = list(remote - self.rows.keys())
+            added = []
+            for i in range(0, len(new_ids), batch_size):
+                added += supabase_client.table(TABLE_NAME)\
+                    .select("id, content, metadata")\
+                    .in_("id", new_ids[i:i + batch_size]).execute().data
+            removed = self.rows.keys() - remote
+            with self.lock:
+                for row_id in removed:
+                    del self.rows[row_id]
+                for row in added:
+                    row_id = str(row["id"])
+                    self.rows[row_id] = {"id": row_id, "content": row["content"], "metadata": row.get("metadata") or {}}
+                if added or removed:
+                    self.version += 1
+            self.last_sync = time.time()
+        return len(added), len(removed)
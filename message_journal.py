@@ -0,0 +1,156 @@
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+import metrics
+
+# --- CONFIGURATION ---
+CACHE_DIR = os.environ.get("MIMI_CACHE_DIR", ".cache")
+SPILL_PATH = os.path.join(CACHE_DIR, "chat_journal.jsonl")
+FLUSH_SIZE = 20            # rows per insert
+FLUSH_INTERVAL = 1.0       # seconds a row may wait before we flush anyway
+MAX_RETRIES = 4
+REPLAY_INTERVAL = 30.0     # seconds between attempts to replay the spill file
+
+_STOP = object()
+
+
+class MessageJournal:
+    """
+    Write-behind queue for chat_history.
+
+    append() only puts the row on a queue (no network on the request path);
+    a background thread flushes batches with one multi-row insert when
+    FLUSH_SIZE rows are waiting or FLUSH_INTERVAL has passed, retrying with
+    back-off. If the database stays unreachable the batch is appended to a
+    local JSONL file and replayed later.
+
+    writer: callable(rows) doing the insert, raising on failure (db.save_messages).
+    """
+
+    def __init__(self, writer, spill_path=SPILL_PATH, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.writer = writer
+        self.spill_path = spill_path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.spill_lock = threading.Lock()
+        self.last_replay = 0.0
+        self.thread = threading.Thread(target=self._run, name="chat-journal", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def append(self, session_id, role, content):
+        # created_at is set here so batching never changes the message order
+        self.queue.put({
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+        metrics.set_gauge("journal.queue_depth", self.queue.qsize())
+
+    def flush(self, timeout=10.0):
+        """
+        Blocks until everything appended so far has been written (or spilled).
+        """
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout=10.0)
+
+    # --- BACKGROUND THREAD ---
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.flush_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+
+            if batch:
+                self._write(batch)
+            self._maybe_replay()
+            metrics.set_gauge("journal.queue_depth", self.queue.qsize())
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _write(self, rows):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                with metrics.timer("journal.flush_seconds"):
+                    self.writer(rows)
+                metrics.incr("journal.rows_written", len(rows))
+                return True
+            except Exception as e:
+                if attempt == MAX_RETRIES:
+                    print(f"Journal: giving up on {len(rows)} rows ({e}), spilling to {self.spill_path}")
+                    self._spill(rows)
+                    return False
+                metrics.incr("journal.retries")
+                time.sleep(min(8.0, 0.25 * 2 ** attempt) + random.uniform(0, 0.25))
+
+    def _spill(self, rows):
+        with self.spill_lock:
+            directory = os.path.dirname(self.spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+        metrics.incr("journal.rows_spilled", len(rows))
+
+    def _maybe_replay(self):
+        """
+        Re-sends spilled rows once the database is reachable again.
+        """
+        if time.monotonic() - self.last_replay < REPLAY_INTERVAL:
+            return
+        self.last_replay = time.monotonic()
+
+        # A leftover .replay file means we crashed mid-replay: finish that one first
+        replay_path = self.spill_path + ".replay"
+        with self.spill_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+        with open(replay_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+        replayed = 0
+        for i in range(0, len(rows), self.flush_size):
+            try:
+                self.writer(rows[i:i + self.flush_size])
+                replayed += len(rows[i:i + self.flush_size])
+            except Exception as e:
+                print(f"Journal replay failed ({e}), will retry later")
+                self._spill(rows[i:])
+                break
+        os.remove(replay_path)
+        metrics.incr("journal.rows_replayed", replayed)
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Process-wide counters and timings.
+# Everything here is shared by all Streamlit sessions running in this worker.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_samples = defaultdict(lambda: deque(maxlen=500))
+
+
+def incr(name: str, amount: int = 1):
+    """
+    Bumps a counter.
+    """
+    with _lock:
+        _counters[name] += amount
+
+
+def counter(name: str) -> int:
+    """
+    Current value of a counter (0 if never bumped).
+    """
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def set_gauge(name: str, value):
+    """
+    Records the current value of something (queue depth, cache size...).
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    """
+    Records one sample (usually seconds). Only the last 500 are kept.
+    """
+    with _lock:
+        _samples[name].append(value)
+
+
+@contextmanager
+def timer(name: str):
+    """
+    Times the block and records it with observe().
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def hit_rate(hits: str, misses: str):
+    """
+    Returns hits / (hits + misses), or None if nothing was recorded yet.
+    """
+    with _lock:
+        h, m = _counters[hits], _counters[misses]
+    return h / (h + m) if h + m else None
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summary(name: str):
+    """
+    Count / last / p50 / p95 for a timing series.
+    """
+    with _lock:
+        values = list(_samples.get(name, ()))
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "last": values[-1],
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+    }
+
+
+def snapshot():
+    """
+    Everything we know, as plain dicts (for the debug panel).
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        names = list(_samples)
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "timings": {name: summary(name) for name in names},
+    }
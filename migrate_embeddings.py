@@ -0,0 +1,78 @@
+"""
+Re-projects the stored embeddings to a smaller profile (see
+migrations/002_compact_embeddings.sql): every row's vector is truncated to
+--dimensions, renormalised and written to --target.
+
+No embedding API calls: gemini-embedding-001 is trained so that the prefix of
+its vector is the embedding at that size. Only rows whose target is still
+empty are read, so the script can be stopped and re-run at any time.
+
+    python migrate_embeddings.py --dimensions 768             (reads .streamlit/secrets.toml)
+    python migrate_embeddings.py --dimensions 768 --dry-run
+
+The local index (RETRIEVAL_BACKEND = "local") needs nothing: it notices the
+new size and rebuilds itself on the next sync.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import clients
+import vector_profile
+
+# --- CONFIGURATION ---
+TABLE_NAME = "documents"
+PAGE_SIZE = 200     # rows read per request
+WORKERS = 8         # updates in flight (PostgREST has no bulk update by id)
+
+
+def migrate(supabase_client, dimensions, source="embedding", target="embedding_compact",
+            page_size=PAGE_SIZE, workers=WORKERS, dry_run=False):
+    """
+    Returns (rows written, rows skipped because they had no vector).
+    Walks the table in id order (keyset), so rows written meanwhile don't
+    shift the pages.
+    """
+    def write(row):
+        vector = vector_profile.truncate(vector_profile.from_pgvector(row[source]), dimensions)
+        supabase_client.table(TABLE_NAME).update({target: vector_profile.to_pgvector(vector)})\
+            .eq("id", row["id"]).execute()
+
+    written = skipped = 0
+    last_id = None
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            query = supabase_client.table(TABLE_NAME).select(f"id, {source}").is_(target, "null")
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            rows = query.order("id").limit(page_size).execute().data
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            todo = [row for row in rows if row.get(source)]
+            skipped += len(rows) - len(todo)
+            if not dry_run:
+                list(pool.map(write, todo))
+            written += len(todo)
+            print(f"{written} rows re-projected to {dimensions} dimensions ({written / (time.time() - started):.0f}/s)")
+    return written, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Truncate stored embeddings to a smaller profile")
+    parser.add_argument("--dimensions", type=int, required=True, choices=vector_profile.DIMENSIONS[:-1])
+    parser.add_argument("--source", default="embedding", help="column holding the full vectors")
+    parser.add_argument("--target", default="embedding_compact", help="column to write (from STEP 1 of the migration)")
+    parser.add_argument("--dry-run", action="store_true", help="read and convert, write nothing")
+    args = parser.parse_args(argv)
+
+    written, skipped = migrate(clients.supabase(), args.dimensions, source=args.source,
+                               target=args.target, dry_run=args.dry_run)
+    print(f"Done: {written} rows {'checked' if args.dry_run else 'written'}, {skipped} without a vector skipped.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
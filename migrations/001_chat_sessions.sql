@@ -0,0 +1,68 @@
+-- Per-session summary of chat_history, kept up to date by triggers.
+-- The sidebar reads this table (keyset-paginated) instead of scanning chat_history.
+-- Run once in the Supabase SQL editor.
+
+create table if not exists chat_sessions (
+    id text primary key,
+    title text not null,
+    last_activity timestamptz not null default now(),
+    message_count integer not null default 0
+);
+
+-- Keyset pagination: ORDER BY last_activity DESC, id DESC
+create index if not exists chat_sessions_activity_idx
+    on chat_sessions (last_activity desc, id desc);
+
+-- get_messages / delete_session filter on this
+create index if not exists chat_history_session_idx
+    on chat_history (session_id, created_at);
+
+-- --- INSERT: create the session on its first message, bump it afterwards ---
+create or replace function chat_sessions_on_insert() returns trigger
+language plpgsql as $$
+begin
+    insert into chat_sessions (id, title, last_activity, message_count)
+    values (new.session_id::text, left(new.content, 30) || '...', coalesce(new.created_at, now()), 1)
+    on conflict (id) do update
+        set last_activity = greatest(chat_sessions.last_activity, excluded.last_activity),
+            message_count = chat_sessions.message_count + 1;
+    return new;
+end;
+$$;
+
+drop trigger if exists chat_history_insert_session on chat_history;
+create trigger chat_history_insert_session
+    after insert on chat_history
+    for each row execute function chat_sessions_on_insert();
+
+-- --- DELETE: decrement, and drop the session when it has no messages left ---
+create or replace function chat_sessions_on_delete() returns trigger
+language plpgsql as $$
+begin
+    update chat_sessions
+        set message_count = message_count - 1
+        where id = old.session_id::text;
+    delete from chat_sessions
+        where id = old.session_id::text and message_count <= 0;
+    return old;
+end;
+$$;
+
+drop trigger if exists chat_history_delete_session on chat_history;
+create trigger chat_history_delete_session
+    after delete on chat_history
+    for each row execute function chat_sessions_on_delete();
+
+-- --- BACKFILL existing history (safe to re-run) ---
+insert into chat_sessions (id, title, last_activity, message_count)
+select
+    session_id::text,
+    left((array_agg(content order by created_at asc))[1], 30) || '...',
+    max(created_at),
+    count(*)
+from chat_history
+group by session_id
+on conflict (id) do update
+    set title = excluded.title,
+        last_activity = excluded.last_activity,
+        message_count = excluded.message_count;
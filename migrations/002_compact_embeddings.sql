@@ -0,0 +1,69 @@
+-- Compact embeddings for `documents`: 768 of gemini-embedding-001's 3072
+-- dimensions (Matryoshka truncation, renormalised: 4x less storage and
+-- payload), plus a binary-quantized HNSW index (96 bytes per row) that
+-- shortlists candidates for match_documents to re-score exactly.
+-- Needs pgvector >= 0.7 (binary_quantize, bit indexes). For 1536 dimensions
+-- replace every 768 below.
+--
+-- Order:
+--   1. STEP 1 in the Supabase SQL editor
+--   2. python migrate_embeddings.py --dimensions 768   (re-projects every row)
+--   3. STEP 2, then set EMBEDDING_DIMENSIONS = 768 in the secrets and restart
+-- Chunks ingested between 1 and 3 only have the old column: run the script
+-- again right before STEP 2, it only touches rows it hasn't done yet.
+
+-- --- STEP 1: the new column ---
+alter table documents add column if not exists embedding_compact vector(768);
+
+-- In-database alternative to migrate_embeddings.py (one long statement):
+-- update documents set embedding_compact = l2_normalize(subvector(embedding, 1, 768))::vector(768)
+--     where embedding_compact is null;
+
+
+-- --- STEP 2: switch over ---
+begin;
+
+-- Kept for a rollback; drop it once the new profile has proven itself
+-- (alter table documents drop column embedding_full) to get the 12 KB/row back.
+alter table documents rename column embedding to embedding_full;
+alter table documents rename column embedding_compact to embedding;
+
+create index if not exists documents_embedding_bq_idx
+    on documents using hnsw ((binary_quantize(embedding)::bit(768)) bit_hamming_ops);
+
+drop function if exists match_documents(vector, float, int);
+
+-- Same name, arguments and result as before, so rag_manager.py doesn't change:
+-- Hamming distance on the sign bits picks `shortlist` rows from the index,
+-- the full-precision cosine orders them.
+create or replace function match_documents(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    shortlist int default 200
+)
+returns table (id uuid, content text, metadata jsonb, similarity float)
+language plpgsql stable as $$
+declare
+    candidates int := greatest(shortlist, match_count * 10);
+begin
+    -- HNSW returns at most ef_search rows
+    perform set_config('hnsw.ef_search', least(candidates, 1000)::text, true);
+    return query
+    select c.id, c.content, c.metadata, c.similarity
+    from (
+        select d.id, d.content, d.metadata, 1 - (d.embedding <=> query_embedding) as similarity
+        from (
+            select documents.id, documents.content, documents.metadata, documents.embedding
+            from documents
+            order by binary_quantize(documents.embedding)::bit(768) <~> binary_quantize(query_embedding)
+            limit candidates
+        ) d
+    ) c
+    where c.similarity > match_threshold
+    order by c.similarity desc
+    limit match_count;
+end;
+$$;
+
+commit;
@@ -0,0 +1,13 @@
+-- One row per ingested file: the fingerprint (ingestion.fingerprint) of the
+-- version whose chunks are in `documents`. Kept here once instead of on every
+-- chunk, so an edited file doesn't rewrite the metadata of all the chunks it
+-- kept, and an unchanged file is recognised before it is even parsed.
+-- Run once in the Supabase SQL editor. Without it ingestion still works, it
+-- just can't skip unchanged files early.
+
+create table if not exists document_sources (
+    source text primary key,
+    doc_hash text not null,
+    chunks integer not null default 0,
+    updated_at timestamptz not null default now()
+);
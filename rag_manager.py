@@ -1,91 +1,233 @@
 import streamlit as st
-import os
-import tempfile
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import SupabaseVectorStore
-from supabase.client import create_client
+import threading
+import time
+
+import clients
+import ingestion
+import semantic_cache
+import tracing
+import vector_profile
+from local_index import DocumentTexts, LocalIndex
+from keyword_index import KeywordIndex, reciprocal_rank_fusion, mmr
 
 # --- CONFIGURATION ---
-# Using the model you have available (3072 dimensions)
-EMBEDDING_MODEL = "models/gemini-embedding-001" 
-
-# 1. Initialize Clients
-embeddings = GoogleGenerativeAIEmbeddings(
-    model=EMBEDDING_MODEL,
-    google_api_key=st.secrets["GEMINI_API_KEY"]
-)
-
-# This is the raw client we will use to bypass the error
-supabase_client = create_client(
-    st.secrets["SUPABASE_URL"],
-    st.secrets["SUPABASE_KEY"]
-)
-
-# Keep this for ingestion (since that part works)
-vector_store = SupabaseVectorStore(
-    client=supabase_client,
-    embedding=embeddings,
-    table_name="documents",
-    query_name="match_documents"
-)
+# "supabase": match_documents RPC, with the local index as offline fallback
+# "local":    in-process NumPy index, synced from the documents table
+RETRIEVAL_BACKEND = st.secrets.get("RETRIEVAL_BACKEND", "supabase")
+LOCAL_INDEX_SYNC_SECONDS = 300
+MATCH_COUNT = 5
+
+# "vector": cosine search only
+# "hybrid": cosine + BM25 keyword search, fused (RRF) and de-duplicated (MMR)
+RETRIEVAL_MODE = st.secrets.get("RETRIEVAL_MODE", "hybrid")
+MATCH_THRESHOLD = float(st.secrets.get("MATCH_THRESHOLD", 0.0))  # min cosine similarity for vector hits
+HYBRID_CANDIDATES = 20  # per retriever, before fusion
+
+# Local index storage: "float32", "int8" or "binary" (quantized shortlist,
+# re-scored in full precision; see local_index.py). The embedding size itself
+# is the EMBEDDING_DIMENSIONS secret, read by clients.embedding_dimensions().
+VECTOR_STORAGE = st.secrets.get("VECTOR_STORAGE", "float32")
+
+# 1. Clients (Gemini embeddings, Supabase) are created on first use, see clients.py
+
+# Built lazily on first use (see get_local_index)
+_local_index = None
+_local_index_lock = threading.Lock()
+_keyword_index = KeywordIndex()
+_document_texts = DocumentTexts()
+_document_texts_lock = threading.Lock()
 
 # --- FUNCTIONS ---
 
-def ingest_pdf(uploaded_file):
+def get_local_index(force_sync=False):
     """
-    Ingests PDF. (This part was working fine, so we keep using LangChain here)
+    The process-wide LocalIndex, synced from `documents` when it is older than
+    LOCAL_INDEX_SYNC_SECONDS (or when force_sync is set, e.g. after an upload).
     """
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_path = tmp_file.name
-
-        loader = PyPDFLoader(tmp_path)
-        docs = loader.load()
-        
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200 
+    global _local_index
+    with _local_index_lock:
+        if _local_index is None:
+            _local_index = LocalIndex(dimensions=clients.embedding_dimensions(), storage=VECTOR_STORAGE)
+        if force_sync or time.time() - _local_index.last_sync > LOCAL_INDEX_SYNC_SECONDS:
+            try:
+                added, removed = _local_index.sync(clients.supabase())
+                if added or removed:
+                    print(f"Local index synced: +{added} -{removed} rows")
+            except Exception as e:
+                # Offline: keep serving whatever we have on disk
+                print(f"Local index sync failed: {e}")
+                _local_index.last_sync = time.time()
+        return _local_index
+
+
+def get_document_texts(force_sync=False):
+    """
+    The chunks the keyword side searches: the local index when it is the
+    backend anyway, else DocumentTexts (content and metadata, no vectors).
+    Both have get(id) and texts(). A stale copy is re-synced by one request
+    while the others keep using it; the first sync and force_sync wait.
+    """
+    if RETRIEVAL_BACKEND == "local":
+        return get_local_index(force_sync)
+    stale = force_sync or time.time() - _document_texts.last_sync > LOCAL_INDEX_SYNC_SECONDS
+    if stale and _document_texts_lock.acquire(blocking=force_sync or not _document_texts.last_sync):
+        try:
+            added, removed = _document_texts.sync(clients.supabase())
+            if added or removed:
+                print(f"Document texts synced: +{added} -{removed} rows")
+        except Exception as e:
+            print(f"Document texts sync failed: {e}")
+            _document_texts.last_sync = time.time()
+        finally:
+            _document_texts_lock.release()
+    return _document_texts
+
+
+def get_keyword_index():
+    """
+    BM25 index over get_document_texts(), updated incrementally
+    (only added/removed chunks) whenever those change.
+    """
+    texts = get_document_texts()
+    if _keyword_index.version != texts.version:
+        _keyword_index.sync(texts.texts(), version=texts.version)
+    return _keyword_index
+
+
+def refresh_after_ingest(stats, sync_index=True):
+    """
+    Called after documents changed. sync_index=False lets a bulk job sync the
+    local index once at the end instead of after every file.
+    """
+    if stats["added"] or stats["removed"]:
+        # Cached answers built from the old documents are now wrong
+        semantic_cache.invalidate_all(semantic_cache.KNOWLEDGE_TOOLS)
+        # The keyword side must see new chunks now, not after the next periodic sync
+        if sync_index and (RETRIEVAL_BACKEND == "local" or RETRIEVAL_MODE == "hybrid"):
+            get_document_texts(force_sync=True)
+
+
+def ingest_chunks(chunks, source, doc_hash, progress=None, total_pages=None, sync_index=True):
+    """
+    Stores already split chunks (see ingestion.parse_pdf_pages). Incremental:
+    chunks already stored for this source are not embedded again, chunks that
+    disappeared are deleted, so re-running after a failure resumes where it
+    stopped. Returns ingestion.run's stats.
+    """
+    with tracing.span("ingest_chunks", source=source):
+        stats = ingestion.run(
+            pages=None,
+            chunks=chunks,
+            embed_documents=clients.embeddings().embed_documents,
+            supabase_client=clients.supabase(),
+            source=source,
+            doc_hash=doc_hash,
+            progress=progress,
+            total_pages=total_pages
         )
-        splits = text_splitter.split_documents(docs)
+    refresh_after_ingest(stats, sync_index=sync_index)
+    return stats
 
-        vector_store.add_documents(splits)
-        
-        os.remove(tmp_path)
-        return f"✅ Success! Added {len(splits)} chunks to memory."
-        
-    except Exception as e:
-        return f"❌ Error: {str(e)}"
 
-def query_knowledge_base(query: str):
+def vector_search(query: str, k: int = MATCH_COUNT, filters: dict = None, threshold: float = MATCH_THRESHOLD):
     """
-    MANUAL OVERRIDE:
-    We call Supabase directly to avoid the 'SyncRPCFilterRequestBuilder' error.
+    Returns the top-k chunks by cosine similarity as [{id, content, metadata, similarity}, ...].
+
+    Uses the backend selected by RETRIEVAL_BACKEND; if the Supabase RPC fails
+    we fall back to the local index (when it has anything in it).
+    filters: optional {metadata_key: value}, e.g. {"source": "manual.pdf"}.
     """
-    try:
-        # 1. Convert text query to vector numbers (Using Google)
-        query_vector = embeddings.embed_query(query)
+    # 1. Convert text query to vector numbers (Using Google, or the cache)
+    query_vector = clients.embeddings().embed_query(query)
+
+    if RETRIEVAL_BACKEND == "local":
+        with tracing.span("local_index.search", k=k):
+            return get_local_index().search(query_vector, k=k, filters=filters, threshold=threshold)
 
+    try:
         # 2. Call the Database Function directly (Bypassing LangChain wrapper)
         # This uses the raw Supabase client, which doesn't have the bug.
-        response = supabase_client.rpc(
-            "match_documents",
-            {
-                "query_embedding": query_vector,
-                "match_threshold": 0.0, # Zero threshold = Find anything (Good for debugging)
-                "match_count": 5
-            }
-        ).execute()
+        with tracing.span("supabase rpc match_documents", k=k):
+            response = clients.supabase().rpc(
+                "match_documents",
+                {
+                    "query_embedding": vector_profile.to_pgvector(query_vector),
+                    "match_threshold": threshold, # Zero threshold = Find anything (Good for debugging)
+                    # The RPC has no metadata filter, so over-fetch and filter here
+                    "match_count": k * 4 if filters else k
+                }
+            ).execute()
+        rows = response.data or []
+        if filters:
+            rows = [r for r in rows if all((r.get("metadata") or {}).get(key) == value for key, value in filters.items())]
+        return rows[:k]
+    except Exception as e:
+        # Loads whatever was synced to disk earlier (the sync itself will fail if we're offline)
+        index = get_local_index()
+        if not len(index):
+            raise
+        print(f"match_documents failed ({e}), answering from the local index")
+        tracing.set_attribute("fallback", "local_index")
+        return index.search(query_vector, k=k, filters=filters, threshold=threshold)
+
+
+def hybrid_search(query: str, k: int = MATCH_COUNT, filters: dict = None):
+    """
+    Vector hits and BM25 keyword hits fused by reciprocal rank, then MMR to
+    drop near-duplicate chunks. Exact terms (project codes, names, dates) that
+    embeddings blur get found by the keyword side.
+    """
+    vector_rows = vector_search(query, k=HYBRID_CANDIDATES, filters=filters)
+
+    keyword_index = get_keyword_index()
+    texts = get_document_texts()
+    allowed = None
+    if filters:
+        allowed = {row_id for row_id in texts.texts()
+                   if all(texts.get(row_id)["metadata"].get(key) == value for key, value in filters.items())}
+    with tracing.span("keyword_index.search"):
+        keyword_hits = keyword_index.search(query, k=HYBRID_CANDIDATES, allowed=allowed)
+
+    rows = {str(row["id"]): row for row in vector_rows}
+    for row_id, _ in keyword_hits:
+        if row_id not in rows:
+            row = texts.get(row_id)
+            if row is not None:
+                rows[row_id] = row
+
+    fused = reciprocal_rank_fusion([
+        [str(row["id"]) for row in vector_rows],
+        [row_id for row_id, _ in keyword_hits],
+    ])
+    return mmr([(rows[row_id], score) for row_id, score in fused if row_id in rows], k)
+
+
+def search_documents(query: str, k: int = MATCH_COUNT, filters: dict = None):
+    """
+    Top-k chunks for a query, using RETRIEVAL_MODE ("hybrid" or "vector").
+    """
+    with tracing.span("rag.search", mode=RETRIEVAL_MODE, backend=RETRIEVAL_BACKEND):
+        if RETRIEVAL_MODE == "hybrid":
+            return hybrid_search(query, k=k, filters=filters)
+        return vector_search(query, k=k, filters=filters)
+
+
+def query_knowledge_base(query: str, filters: dict = None):
+    """
+    MANUAL OVERRIDE:
+    We call Supabase directly to avoid the 'SyncRPCFilterRequestBuilder' error
+    (or the local index, see search_documents).
+    """
+    try:
+        rows = search_documents(query, filters=filters)
 
         # 3. Extract the text
-        if not response.data:
+        if not rows:
             return "No relevant information found in the database."
-            
+
         # Combine the "content" field from the top results
-        results_text = "\n\n---\n\n".join([item['content'] for item in response.data])
+        results_text = "\n\n---\n\n".join([item['content'] for item in rows])
         return results_text
 
     except Exception as e:
-        return f"Database Search Error: {str(e)}"
\ No newline at end of file
+        return f"Database Search Error: {str(e)}"
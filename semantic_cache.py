@@ -0,0 +1,171 @@
+import contextvars
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+import metrics
+from embedding_cache import normalize
+
+# --- CONFIGURATION ---
+SIMILARITY_THRESHOLD = 0.92   # cosine similarity for two questions to count as "the same"
+MAX_ENTRIES = 1000
+DEFAULT_TTL = 300
+
+# Seconds an answer may be reused, by the agent/tool it came from.
+# An answer's TTL is the shortest among everything that was used to produce it.
+TTLS = {
+    "Calendar_Specialist": 60,
+    "list_upcoming_events": 60,
+    "Communication_Specialist": 60,
+    "read_emails": 60,
+    "Research_Specialist": 600,
+    "Knowledge_Specialist": 3600,
+    "consult_knowledge_base": 3600,
+}
+
+# Answers that involved these are never stored (replaying them would skip the side effect)
+NEVER_CACHE = {"send_email", "create_calendar_event"}
+
+# Answers that depend on the documents table (dropped when a PDF is ingested)
+KNOWLEDGE_TOOLS = {"Knowledge_Specialist", "consult_knowledge_base"}
+
+# Stack of sets collecting the tools used by the runs we are inside of
+_tracking = contextvars.ContextVar("semantic_cache_tracking", default=())
+_instances = weakref.WeakSet()
+
+
+@contextmanager
+def track():
+    """
+    Collects the names passed to note() while the block runs (including from
+    nested specialists and tool threads that inherit our context).
+    """
+    used = set()
+    token = _tracking.set(_tracking.get() + (used,))
+    try:
+        yield used
+    finally:
+        _tracking.reset(token)
+
+
+def note(*names):
+    """
+    Records that a tool/agent took part in the current run(s).
+    """
+    for used in _tracking.get():
+        used.update(names)
+
+
+def tool_names(messages):
+    """
+    Names of every tool the agent called, from a result's message list.
+    """
+    names = set()
+    for message in messages:
+        for call in getattr(message, "tool_calls", None) or []:
+            names.add(call["name"])
+    return names
+
+
+def context_fingerprint(*parts):
+    """
+    Hash of whatever else the answer depends on (previous reply, today's date...).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def invalidate_all(depends_on=KNOWLEDGE_TOOLS):
+    """
+    Drops matching entries from every cache in the process (called after ingest).
+    """
+    for cache in list(_instances):
+        cache.invalidate(depends_on)
+
+
+class SemanticCache:
+    """
+    Answers keyed by the embedding of the normalised question (plus a context
+    fingerprint), looked up by cosine similarity. LRU-bounded, per-entry TTL.
+    Namespaces keep each agent's answers apart ("Mimi_Root", "Calendar_Specialist"...).
+    """
+
+    def __init__(self, embed_query, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES):
+        self.embed_query = embed_query
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # key -> dict(namespace, fingerprint, vector, answer, expires, depends_on)
+        _instances.add(self)
+
+    def _vector(self, query):
+        vector = np.asarray(self.embed_query(normalize(query, casefold=True)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace, query, fingerprint=""):
+        """
+        Returns (answer, depends_on) of the closest fresh entry, or None.
+        """
+        vector = self._vector(query)
+        now = time.time()
+        best_key, best_score = None, self.threshold
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if entry["expires"] < now:
+                    del self.entries[key]
+                    continue
+                if entry["namespace"] != namespace or entry["fingerprint"] != fingerprint:
+                    continue
+                score = float(entry["vector"] @ vector)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                metrics.incr("semantic_cache.misses")
+                return None
+            self.entries.move_to_end(best_key)
+            entry = self.entries[best_key]
+        metrics.incr("semantic_cache.hits")
+        return entry["answer"], entry["depends_on"]
+
+    def store(self, namespace, query, answer, fingerprint="", depends_on=()):
+        """
+        Caches an answer unless a side-effecting tool was involved.
+        depends_on: tools/agents used to produce it (decides the TTL).
+        """
+        depends_on = set(depends_on) | {namespace}
+        if depends_on & NEVER_CACHE or not answer:
+            metrics.incr("semantic_cache.skipped")
+            return
+        ttl = min(TTLS.get(name, DEFAULT_TTL) for name in depends_on)
+        entry = {
+            "namespace": namespace,
+            "fingerprint": fingerprint,
+            "vector": self._vector(query),
+            "answer": answer,
+            "expires": time.time() + ttl,
+            "depends_on": depends_on,
+        }
+        key = (namespace, fingerprint, normalize(query, casefold=True))
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            metrics.set_gauge("semantic_cache.entries", len(self.entries))
+
+    def invalidate(self, depends_on):
+        depends_on = set(depends_on)
+        with self.lock:
+            stale = [key for key, entry in self.entries.items() if entry["depends_on"] & depends_on]
+            for key in stale:
+                del self.entries[key]
+        metrics.incr("semantic_cache.invalidated", len(stale))
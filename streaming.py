@@ -0,0 +1,63 @@
+import time
+from langchain_core.messages import AIMessageChunk
+
+import metrics
+import tool_executor
+import semantic_cache
+
+
+def _render_progress(status, panels, event):
+    """
+    Shows what a specialist is doing inside the st.status block.
+    Events come from AgentFactory.create_agent_as_tool (via the stream writer).
+    """
+    agent = event.get("agent", "specialist")
+    kind = event.get("event")
+
+    if kind == "start":
+        status.write(f"🔧 **{agent}** ← {event.get('query', '')}")
+        panels[agent] = {"box": status.empty(), "text": ""}
+    elif kind == "token" and agent in panels:
+        panel = panels[agent]
+        panel["text"] += event.get("text", "")
+        # Only the tail, long answers would push everything else out of view
+        panel["box"].caption(panel["text"][-400:])
+    elif kind == "end":
+        status.write(f"✅ {agent} done")
+
+
+def stream_turn(agent, inputs, status):
+    """
+    Runs the root agent in streaming mode (async, so parallel tool calls overlap).
+
+    Yields the root agent's text tokens as they arrive (feed this to st.write_stream)
+    and renders tool calls / sub-agent tokens into `status` on the way.
+    Records time-to-first-token and total turn time in metrics.
+    """
+    start = time.perf_counter()
+    first_token = True
+    panels = {}
+
+    events = tool_executor.iterate(lambda: agent.astream(inputs, stream_mode=["messages", "custom"]))
+    for mode, chunk in events:
+        if mode == "custom":
+            _render_progress(status, panels, chunk)
+            continue
+
+        message, meta = chunk
+        # Tool results also come through "messages", we only want the root model's output
+        if meta.get("langgraph_node") != "model" or not isinstance(message, AIMessageChunk):
+            continue
+
+        for call in message.tool_call_chunks or []:
+            if call.get("name"):
+                semantic_cache.note(call["name"])
+                status.write(f"📞 Calling {call['name']}...")
+
+        if message.content:
+            if first_token:
+                metrics.observe("chat.ttft_seconds", time.perf_counter() - start)
+                first_token = False
+            yield message.content
+
+    metrics.observe("chat.turn_seconds", time.perf_counter() - start)
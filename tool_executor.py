@@ -0,0 +1,115 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+
+import metrics
+
+# --- CONFIGURATION ---
+# How many specialist calls one user can have in flight at the same time.
+# (A session only runs one turn at a time, so "per turn" == "per user" here.)
+MAX_CONCURRENT_TOOLS_PER_USER = 3
+
+# Seconds before we give up on a specialist and tell the root agent so.
+DEFAULT_TOOL_TIMEOUT = 60
+TOOL_TIMEOUTS = {
+    "Research_Specialist": 45,
+    "Calendar_Specialist": 30,
+    "Communication_Specialist": 30,
+    "Knowledge_Specialist": 30,
+}
+
+# Set at the start of every turn, inherited by all tool tasks of that turn
+_turn_limit = contextvars.ContextVar("turn_limit", default=None)
+
+
+def timeout_for(name: str):
+    return TOOL_TIMEOUTS.get(name, DEFAULT_TOOL_TIMEOUT)
+
+
+async def run_tool(name: str, make_coro):
+    """
+    Runs one async tool call under the user's concurrency cap and its timeout.
+    make_coro: zero-arg callable returning the coroutine (so nothing starts
+    before we hold a slot).
+    Raises asyncio.TimeoutError if the tool takes longer than timeout_for(name).
+    """
+    limit = _turn_limit.get()
+    queued = time.perf_counter()
+
+    if limit is None:
+        # Called outside run()/iterate(): no cap, but still bounded in time
+        return await asyncio.wait_for(make_coro(), timeout_for(name))
+
+    async with limit:
+        metrics.observe("tools.wait_seconds", time.perf_counter() - queued)
+        with metrics.timer(f"tools.{name}.seconds"):
+            return await asyncio.wait_for(make_coro(), timeout_for(name))
+
+
+def _new_turn():
+    _turn_limit.set(asyncio.Semaphore(MAX_CONCURRENT_TOOLS_PER_USER))
+
+
+def run(make_coro):
+    """
+    Runs a coroutine (e.g. mimi.ainvoke) to completion from sync Streamlit code.
+    Parallel tool calls inside it share one concurrency cap.
+    """
+    async def turn():
+        _new_turn()
+        return await make_coro()
+
+    return asyncio.run(turn())
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+def _attach_streamlit_context(thread):
+    # Tools may call st.* (e.g. st.error), which needs the script's context
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        add_script_run_ctx(thread, get_script_run_ctx())
+    except Exception:
+        pass
+
+
+def iterate(make_async_gen):
+    """
+    Consumes an async generator (e.g. mimi.astream) from sync code.
+
+    The event loop runs on a helper thread so that we can keep yielding items
+    (and drawing them) on the Streamlit thread while tools run concurrently.
+    """
+    items = queue.Queue()
+
+    async def pump():
+        _new_turn()
+        try:
+            async for item in make_async_gen():
+                items.put(item)
+        except BaseException as e:
+            items.put(_Failure(e))
+        finally:
+            items.put(_DONE)
+
+    # Threads don't inherit contextvars: run the loop inside a copy of ours
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(asyncio.run, pump()), daemon=True)
+    _attach_streamlit_context(thread)
+    thread.start()
+
+    while True:
+        item = items.get()
+        if item is _DONE:
+            break
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
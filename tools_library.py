@@ -1,19 +1,18 @@
 import streamlit as st
-from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-import json
 from datetime import datetime
 import base64
 from email.mime.text import MIMEText
 import rag_manager
+import google_services
+import tracing
 
 
 # --- 1. WEB SEARCH TOOL ---
 def get_search_tool():
     if "TAVILY_API_KEY" not in st.secrets: return None
+    from langchain_community.tools.tavily_search import TavilySearchResults
     return TavilySearchResults(max_results=5)
 
 # --- 2. CALENDAR TOOLS ---
@@ -29,16 +28,15 @@ def create_calendar_event(summary: str, start_time: str, end_time: str) -> str:
     """Create a new calendar event in the primary calendar."""
     try:
         if "GOOGLE_TOKEN" not in st.secrets: return "Error: No Google Token found."
-        token_info = json.loads(st.secrets["GOOGLE_TOKEN"])
-        creds = Credentials.from_authorized_user_info(token_info)
-        service = build('calendar', 'v3', credentials=creds)
+        service = google_services.get_service(st.secrets["GOOGLE_TOKEN"], 'calendar', 'v3')
         
         event = {
             'summary': summary,
             'start': {'dateTime': start_time, 'timeZone': 'UTC'}, 
             'end': {'dateTime': end_time, 'timeZone': 'UTC'},
         }
-        event = service.events().insert(calendarId='primary', body=event).execute()
+        with tracing.span("google calendar.events.insert"):
+            event = service.events().insert(calendarId='primary', body=event).execute()
         return f"Event created: {event.get('htmlLink')}"
     except Exception as e: return f"Error creating event: {e}"
 
@@ -47,12 +45,11 @@ def list_upcoming_events() -> str:
     """Get the next 10 events from the user's primary calendar."""
     try:
         if "GOOGLE_TOKEN" not in st.secrets: return "Error: No Google Token found."
-        token_info = json.loads(st.secrets["GOOGLE_TOKEN"])
-        creds = Credentials.from_authorized_user_info(token_info)
-        service = build('calendar', 'v3', credentials=creds)
+        service = google_services.get_service(st.secrets["GOOGLE_TOKEN"], 'calendar', 'v3')
         
         now = datetime.utcnow().isoformat() + 'Z'
-        events = service.events().list(calendarId='primary', timeMin=now, maxResults=10, singleEvents=True, orderBy='startTime').execute().get('items', [])
+        with tracing.span("google calendar.events.list"):
+            events = service.events().list(calendarId='primary', timeMin=now, maxResults=10, singleEvents=True, orderBy='startTime').execute().get('items', [])
         
         if not events: return "No upcoming events found."
         return "\n".join([f"ID: {e['id']} | {e['start'].get('dateTime', e['start'].get('date'))}: {e['summary']}" for e in events])
@@ -71,16 +68,15 @@ def send_email(to: str, subject: str, body: str) -> str:
     """Send an email using Gmail."""
     try:
         if "GOOGLE_TOKEN" not in st.secrets: return "Error: No Google Token found."
-        token_info = json.loads(st.secrets["GOOGLE_TOKEN"])
-        creds = Credentials.from_authorized_user_info(token_info)
-        service = build('gmail', 'v1', credentials=creds)
+        service = google_services.get_service(st.secrets["GOOGLE_TOKEN"], 'gmail', 'v1')
 
         message = MIMEText(body)
         message['to'] = to
         message['subject'] = subject
         raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
         
-        sent = service.users().messages().send(userId='me', body={'raw': raw_message}).execute()
+        with tracing.span("google gmail.messages.send"):
+            sent = service.users().messages().send(userId='me', body={'raw': raw_message}).execute()
         return f"Email sent! ID: {sent['id']}"
     except Exception as e:
         # --- ADD THIS DEBUG LINE ---
@@ -92,19 +88,27 @@ def read_emails(max_results: int = 5) -> str:
     """Read latest UNREAD emails from the inbox."""
     try:
         if "GOOGLE_TOKEN" not in st.secrets: return "Error: No Google Token found."
-        token_info = json.loads(st.secrets["GOOGLE_TOKEN"])
-        creds = Credentials.from_authorized_user_info(token_info)
-        service = build('gmail', 'v1', credentials=creds)
+        service = google_services.get_service(st.secrets["GOOGLE_TOKEN"], 'gmail', 'v1')
 
-        results = service.users().messages().list(userId='me', q='is:unread', maxResults=max_results).execute()
+        with tracing.span("google gmail.messages.list"):
+            results = service.users().messages().list(userId='me', q='is:unread', maxResults=max_results).execute()
         messages = results.get('messages', [])
         
         if not messages: return "No new unread emails."
-        
+
+        # One batched round trip for all messages, headers we show only
+        requests = [
+            service.users().messages().get(userId='me', id=msg['id'], format='metadata', metadataHeaders=['Subject', 'From'])
+            for msg in messages
+        ]
         summaries = []
-        for msg in messages:
-            data = service.users().messages().get(userId='me', id=msg['id']).execute()
-            headers = data['payload']['headers']
+        with tracing.span("google gmail.batch_get", messages=len(requests)):
+            responses = google_services.batch_execute(service, requests)
+        for data in responses:
+            if isinstance(data, Exception):
+                summaries.append(f"(Could not load message: {data})")
+                continue
+            headers = data['payload'].get('headers', [])
             subject = next((h['value'] for h in headers if h['name'] == 'Subject'), "No Subject")
             sender = next((h['value'] for h in headers if h['name'] == 'From'), "Unknown")
             summaries.append(f"From: {sender} | Subject: {subject} | Snippet: {data.get('snippet', '')}")
@@ -120,8 +124,8 @@ def consult_knowledge_base(query: str):
     Args:
         query: The specific topic to search for (e.g., "Project Alpha timeline").
     """
-    print(f"DEBUG: Searching database for '{query}'...") # Check your terminal logs!
-    response = rag_manager.query_knowledge_base(query)
+    with tracing.span("tool consult_knowledge_base", query=query):
+        response = rag_manager.query_knowledge_base(query)
     if not response:
         return "I checked the documents but found nothing relevant."
     return f"Here is what I found in the internal docs:\n{response}"
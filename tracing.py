@@ -0,0 +1,252 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# --- CONFIGURATION ---
+CACHE_DIR = os.environ.get("MIMI_CACHE_DIR", ".cache")
+TRACE_PATH = os.environ.get("MIMI_TRACE_PATH", os.path.join(CACHE_DIR, "traces.jsonl"))
+KEEP_TRACES = 50   # finished traces kept in memory for the debug panel
+MAX_TRACE_BYTES = int(os.environ.get("MIMI_TRACE_MAX_BYTES", 20 * 1024 * 1024))   # then rotated to TRACE_PATH + ".1"
+
+_current = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_recent = OrderedDict()   # trace_id -> [span dicts]
+
+
+class Span:
+    """
+    One timed operation. Spans of a trace share a list so that spans finished
+    on other threads (tools, LLM callbacks) still end up in the same trace.
+    """
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.collector = parent.collector if parent else []
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = "OK"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def incr(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def event(self, name, **attributes):
+        self.events.append({"name": name, "timeUnixNano": time.time_ns(), "attributes": attributes})
+
+    def fail(self, error):
+        self.status = "ERROR"
+        self.attributes["error"] = str(error)[:500]
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        # OpenTelemetry-style field names, so the JSONL can be converted/imported as is
+        record = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status},
+        }
+        with _lock:
+            self.collector.append(record)
+        if self.parent_id is None:
+            _finish_trace(self.trace_id, self.collector)
+
+
+def _finish_trace(trace_id, spans):
+    with _lock:
+        _recent[trace_id] = spans
+        while len(_recent) > KEEP_TRACES:
+            _recent.popitem(last=False)
+    try:
+        directory = os.path.dirname(TRACE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in spans)
+        with _lock:
+            _rotate()
+            with open(TRACE_PATH, "a", encoding="utf-8") as f:
+                f.write(lines)
+    except Exception as e:
+        print(f"Could not write trace: {e}")
+
+
+def _rotate():
+    """
+    Keeps the trace log bounded: past MAX_TRACE_BYTES the file becomes
+    TRACE_PATH.1 (replacing the previous one) and a new one is started,
+    so at most twice the limit is on disk.
+    """
+    try:
+        if os.path.getsize(TRACE_PATH) < MAX_TRACE_BYTES:
+            return
+    except OSError:
+        return
+    os.replace(TRACE_PATH, TRACE_PATH + ".1")
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times the block as a child of the current span (or as a new trace).
+    Exceptions are recorded on the span and re-raised.
+    """
+    current = Span(name, parent=_current.get(), attributes=attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def traced(name=None):
+    """
+    Decorator version of span() for plain and async functions.
+    """
+    def decorate(fn):
+        label = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(label):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current():
+    """
+    The active span, or None.
+    """
+    return _current.get()
+
+
+def set_attribute(key, value):
+    active = _current.get()
+    if active is not None:
+        active.set(key, value)
+
+
+def incr_attribute(key, amount=1):
+    active = _current.get()
+    if active is not None:
+        active.incr(key, amount)
+
+
+def in_context(fn):
+    """
+    Binds fn to the current context, for work handed to a thread pool
+    (threads don't inherit the active span otherwise).
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
+
+
+def get_trace(trace_id):
+    with _lock:
+        spans = _recent.get(trace_id)
+        return list(spans) if spans else None
+
+
+def waterfall(trace_id, width=40):
+    """
+    Text waterfall of a finished trace: one line per span, indented by depth,
+    with a bar showing when it ran relative to the whole turn.
+    """
+    spans = get_trace(trace_id)
+    if not spans:
+        return None
+    start = min(s["startTimeUnixNano"] for s in spans)
+    total = max(s["endTimeUnixNano"] for s in spans) - start or 1
+    parents = {s["spanId"]: s["parentSpanId"] for s in spans}
+
+    def depth(span_id):
+        level = 0
+        while parents.get(span_id):
+            span_id = parents[span_id]
+            level += 1
+        return level
+
+    lines = []
+    for s in sorted(spans, key=lambda s: s["startTimeUnixNano"]):
+        offset = int((s["startTimeUnixNano"] - start) / total * width)
+        length = max(1, int((s["endTimeUnixNano"] - s["startTimeUnixNano"]) / total * width))
+        bar = " " * offset + "█" * min(length, width - offset)
+        label = ("  " * depth(s["spanId"]) + s["name"])[:34]
+        seconds = (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e9
+        extras = []
+        for key in ("input_tokens", "output_tokens", "retries"):
+            if key in s["attributes"]:
+                extras.append(f"{key.split('_')[0]}={s['attributes'][key]}")
+        if s["status"]["code"] != "OK":
+            extras.append("ERROR")
+        lines.append(f"{label:<34} |{bar:<{width}}| {seconds:6.2f}s {' '.join(extras)}")
+    return "\n".join(lines)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Records every chat model call as a span (model, token counts, wall time)
+    under whatever span was active when the call started.
+    """
+
+    run_inline = True   # keep callbacks in the caller's context (async runs too)
+
+    def __init__(self):
+        self.open = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or "llm"
+        self.open[run_id] = Span(f"llm {model}", parent=_current.get(),
+                                 attributes={"llm.messages": sum(len(m) for m in messages)})
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        current = self.open.pop(run_id, None)
+        if current is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not usage and response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            meta = getattr(message, "usage_metadata", None) or {}
+            usage = {"prompt_tokens": meta.get("input_tokens"), "completion_tokens": meta.get("output_tokens")}
+        if usage.get("prompt_tokens") is not None:
+            current.set("input_tokens", usage.get("prompt_tokens"))
+            current.set("output_tokens", usage.get("completion_tokens"))
+        current.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        current = self.open.pop(run_id, None)
+        if current is not None:
+            current.fail(error)
+            current.end()
@@ -0,0 +1,117 @@
+import json
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# gemini-embedding-001 is trained so that a prefix of its vector is itself a
+# good embedding (Matryoshka): keep the first N dimensions and renormalise.
+FULL_DIMENSIONS = 3072
+DIMENSIONS = (768, 1536, 3072)
+
+# How the local index keeps vectors in memory for the first pass:
+# "float32" (exact), "int8" (4x smaller) or "binary" (32x smaller, sign bits).
+# Quantized scores only pick a shortlist, which is re-scored in full precision.
+STORAGES = ("float32", "int8", "binary")
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def truncate(vectors, dimensions):
+    """
+    First `dimensions` components, renormalised to unit length.
+    Works on one vector or a matrix of them; no-op at full size.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dimensions and vectors.shape[-1] > dimensions:
+        vectors = vectors[..., :dimensions]
+    return normalize(vectors)
+
+
+def quantize_int8(matrix):
+    """
+    Symmetric per-row int8 codes: row ~= codes * scale.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales).astype(np.int8)
+    return codes, scales.astype(np.float32).ravel()
+
+
+def quantize_binary(matrix):
+    """
+    One bit per dimension (the sign), packed 8 per byte.
+    """
+    return np.packbits(np.asarray(matrix) > 0, axis=-1)
+
+
+def int8_scores(codes, scales, query, block=512):
+    """
+    Approximate dot products of every row with `query` (float32).
+    Blocked so the int8 -> float32 copy stays in the CPU cache.
+    """
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), block):
+        part = codes[start:start + block].astype(np.float32)
+        scores[start:start + block] = (part @ query) * scales[start:start + block]
+    return scores
+
+
+def hamming_scores(bits, query):
+    """
+    Minus the Hamming distance between each row's sign bits and the query's
+    (higher is more similar, like a dot product).
+    """
+    query_bits = quantize_binary(query[None, :])[0]
+    return -_POPCOUNT[np.bitwise_xor(bits, query_bits)].sum(axis=1, dtype=np.int32)
+
+
+def to_pgvector(vector, decimals=6):
+    """
+    pgvector text literal, "[0.012346,-0.045602,...]". Sent instead of a JSON
+    list of full-repr floats: less than half the bytes, and the rounding error
+    (5e-7) is below what matters for a cosine.
+    """
+    rounded = np.round(np.asarray(vector, dtype=np.float64), decimals)
+    return json.dumps(rounded.tolist(), separators=(",", ":"))
+
+
+def from_pgvector(value):
+    """
+    float32 vector from a pgvector column: PostgREST returns it as the
+    "[0.1,0.2,...]" text literal.
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+class TruncatedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings client and returns truncate(vector, dimensions).
+    Put it outside the embedding cache so the cache keeps full vectors and
+    changing the profile doesn't cost any API calls.
+    """
+
+    def __init__(self, inner, dimensions):
+        self.inner = inner
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts):
+        vectors = self.inner.embed_documents(texts)
+        if not vectors or self.dimensions >= len(vectors[0]):
+            return vectors
+        return truncate(vectors, self.dimensions).tolist()
+
+    def embed_query(self, text):
+        vector = self.inner.embed_query(text)
+        if self.dimensions >= len(vector):
+            return vector
+        return truncate(vector, self.dimensions).tolist()